@@ -23,6 +23,8 @@ from six.moves import configparser
 
 from mos_tests.environment.devops_client import DevopsClient
 from mos_tests.environment.fuel_client import FuelClient
+from mos_tests.environment import os_actions
+from mos_tests.environment import ssh
 from mos_tests.functions.common import gen_temp_file
 from mos_tests.functions.common import get_os_conn
 from mos_tests.functions.common import wait
@@ -37,6 +39,7 @@ logger = logging.getLogger(__name__)
 
 # Define pytest plugins to use
 pytest_plugins = ("mos_tests.plugins.incremental",
+                  "mos_tests.plugins.stats_reports",
                   "mos_tests.plugins.testrail_id")
 
 
@@ -49,6 +52,9 @@ def pytest_addoption(parser):
                      help="Fuel devops snapshot name")
     parser.addoption("--cluster", '-C', action="append",
                      help="Fuel cluster name to test on it")
+    parser.addoption("--ssh-warmup", action="store_true",
+                     help="Connect to all cluster nodes by ssh in parallel "
+                          "before first test")
 
 
 def pytest_configure(config):
@@ -117,6 +123,12 @@ def fuel_master_ip(request, env_name, snapshot_name):
 def revert_snapshot(env_name, snapshot_name):
     DevopsClient.revert_snapshot(env_name=env_name,
                                  snapshot_name=snapshot_name)
+    # all pooled connections are dead after revert
+    ssh.pool.clear()
+    ssh.tunnels.clear()
+    ssh.facts.clear()
+    ssh.breaker.reset()
+    os_actions.auth_cache.clear()
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -128,6 +140,29 @@ def setup_session(request, env_name, snapshot_name):
     revert_snapshot(env_name, snapshot_name)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def ssh_warmup(request, setup_session):
+    """Establish pooled ssh connections to all cluster nodes in parallel
+
+    Reports connect latency of each node, so slow or unreachable nodes are
+    visible before first test.
+    """
+    if not request.config.getoption("--ssh-warmup"):
+        return
+    fuel = request.getfixturevalue('fuel')
+    nodes = [node for env in fuel.get_all_cluster()
+             for node in env.get_all_nodes()]
+    logger.info('Warm up ssh connections to {} nodes'.format(len(nodes)))
+    results = ssh.run_on_nodes(nodes, 'true', concurrency=len(nodes) or 1)
+    for host, result in results.items():
+        if result.is_ok:
+            logger.info('ssh to {0} is ready in {1:.2f}s'.format(
+                host, result.duration))
+        else:
+            logger.warning('ssh to {0} failed after {1:.2f}s: {2}'.format(
+                host, result.duration, result.error))
+
+
 def reinit_fixtures(request):
     """Refresh some session fixtures (after revert, for example)"""
     logger.info('refresh clients fixtures')
@@ -234,16 +269,15 @@ def set_openstack_environ(fuel_master_ip):
     """Set os.environ variables from openrc file"""
     logger.info("read OpenStack openrc file")
     controllers = env.get_nodes_by_role('controller')[0]
-    with controllers.ssh() as remote:
-        result = remote.check_call('env -0')
-        before_vars = set(result['stdout'][-1].strip().split('\x00'))
-        result = remote.check_call('. openrc && env -0')
-        after_vars = set(result['stdout'][-1].strip().split('\x00'))
-        for os_var in after_vars - before_vars:
-            k, v = os_var.split('=', 1)
-            if v == 'internalURL':
-                v = 'publicURL'
-            os.environ[k] = v
+    result = ssh.facts.check_call(controllers.ssh(), 'env -0')
+    before_vars = set(result['stdout'][-1].strip().split('\x00'))
+    result = ssh.facts.check_call(controllers.ssh(), '. openrc && env -0')
+    after_vars = set(result['stdout'][-1].strip().split('\x00'))
+    for os_var in after_vars - before_vars:
+        k, v = os_var.split('=', 1)
+        if v == 'internalURL':
+            v = 'publicURL'
+        os.environ[k] = v
 
 
 @pytest.fixture(scope='class')
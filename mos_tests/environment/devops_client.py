@@ -147,8 +147,8 @@ class EnvProxy(object):
             remote.execute('hwclock --hctosys')
             logger.info("sync time on {} slaves".format(slaves_count))
             remote.execute('for i in {{1..{0}}}; '
-                           'do (ssh node-$i "hwclock --hctosys") done'.format(
-                               slaves_count))
+                           'do (ssh node-$i "hwclock --hctosys") & done; '
+                           'wait'.format(slaves_count))
 
 
 class DevopsClient(object):
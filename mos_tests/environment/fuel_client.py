@@ -25,6 +25,7 @@ from paramiko import RSAKey
 from paramiko import ssh_exception
 
 from mos_tests.environment.os_actions import OpenStackActions
+from mos_tests.environment import ssh
 from mos_tests.environment.ssh import SSHClient
 from mos_tests.functions.common import gen_temp_file
 from mos_tests.functions.common import wait
@@ -208,9 +209,10 @@ class Environment(environment.Environment):
     def leader_controller(self):
         controllers = self.get_nodes_by_role('controller')
         controller_ip = controllers[0].data['ip']
-        with self.get_ssh_to_node(controller_ip) as remote:
-            response = remote.check_call(
-                'pcs status cluster | grep "Current DC:"')
+        # DC can be re-elected without node restart, so keep it shortly
+        response = ssh.facts.check_call(
+            self.get_ssh_to_node(controller_ip),
+            'pcs status cluster | grep "Current DC:"', ttl=10)
         stdout = response.stdout_string
         for controller in controllers:
             if controller.data['fqdn'] in stdout:
@@ -220,13 +222,12 @@ class Environment(environment.Environment):
     def primary_controller(self):
         controllers = self.get_nodes_by_role('controller')
         for controller in controllers:
-            with controller.ssh() as remote:
-                response = remote.execute('hiera roles')
-                stdout = ' '.join(response['stdout'])
-                logger.debug('hiera roles for {} is {}'.format(
-                    controller.data['fqdn'], stdout))
-                if 'primary-controller' in stdout:
-                    return controller
+            response = ssh.facts.execute(controller.ssh(), 'hiera roles')
+            stdout = ' '.join(response['stdout'])
+            logger.debug('hiera roles for {} is {}'.format(
+                controller.data['fqdn'], stdout))
+            if 'primary-controller' in stdout:
+                return controller
         else:
             raise Exception("Can't find primary controller")
 
@@ -245,6 +246,11 @@ class Environment(environment.Environment):
                     for node in devops_nodes]
         for node in devops_nodes:
             node.destroy()
+        for ip in node_ips:
+            ssh.pool.discard(ip)
+            ssh.tunnels.discard(ip)
+        # topology facts (pacemaker DC, etc.) may change with any node
+        ssh.facts.clear()
         wait(lambda: self.check_nodes_get_offline_state(node_ips),
              timeout_seconds=10 * 60,
              waiting_for='the nodes get offline state')
@@ -271,6 +277,8 @@ class Environment(environment.Environment):
         for node in devops_nodes:
             logger.info('Starting node {}'.format(node.name))
             node.create()
+        ssh.facts.clear()
+        ssh.breaker.reset()
         wait(self.check_nodes_get_online_state, timeout_seconds=10 * 60)
         logger.info('wait until the nodes get online state')
         for node in self.get_all_nodes():
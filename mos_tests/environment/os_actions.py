@@ -12,8 +12,15 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
 import logging
+from multiprocessing.pool import ThreadPool
+import os
 import random
+import re
+import sys
+import threading
+import time
 
 from cinderclient import client as cinderclient
 from glanceclient.v2.client import Client as GlanceClient
@@ -26,15 +33,134 @@ from neutronclient.v2_0 import client as neutron_client
 from novaclient import client as nova_client
 from novaclient.exceptions import ClientException as NovaClientException
 import paramiko
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 import six
+from six.moves.urllib import parse as urlparse
 
+from mos_tests import settings
+from mos_tests.environment.ssh import NetnsTunnel
 from mos_tests.environment.ssh import SSHClient
+from mos_tests.functions.common import cached_property
 from mos_tests.functions.common import gen_temp_file
+from mos_tests.functions.common import status_poller
+from mos_tests.functions.common import TEMP_DIR
 from mos_tests.functions.common import wait
 from mos_tests.functions import os_cli
+from mos_tests.functions.stats import Metrics
 
 logger = logging.getLogger(__name__)
 
+# OpenStack API requests durations by service and method
+api_metrics = Metrics()
+
+
+def get_cert_file(cert):
+    """Return path to file with cert, file is written once per content"""
+    if isinstance(cert, six.text_type):
+        cert = cert.encode('utf-8')
+    path = os.path.join(TEMP_DIR, 'fuel_cert_{}.pem'.format(
+        hashlib.sha1(cert).hexdigest()))
+    if not os.path.exists(path):
+        with gen_temp_file(prefix="fuel_cert_", suffix=".pem") as f:
+            f.write(cert)
+        # rename is atomic, so parallel sessions never see partial file
+        os.rename(f.name, path)
+    return path
+
+
+class CachedPassword(KeystonePassword):
+    """Keystone password auth, which refreshes token before it expires"""
+
+    refresh_margin = settings.KEYSTONE_TOKEN_REFRESH_MARGIN
+
+    def _needs_reauthenticate(self):
+        if self.auth_ref is None:
+            return True
+        lifetime = self.auth_ref.expires - self.auth_ref.issued
+        margin = min(self.refresh_margin, lifetime.total_seconds() / 3)
+        return self.auth_ref.will_expire_soon(margin)
+
+
+class KeystoneAuthCache(object):
+    """Shared keystone auth plugins (with tokens and service catalogs)
+
+    Plugins are keyed by (auth_url, user, project, password hash), so all
+    clients of same credentials authenticate once, and a client with
+    changed password never gets a token of the old one.
+    """
+
+    def __init__(self):
+        self.plugins = {}
+        self._lock = threading.Lock()
+
+    def get(self, auth_url, username, password, tenant_name):
+        password_hash = hashlib.sha1(
+            six.text_type(password).encode('utf-8')).hexdigest()
+        key = (auth_url, username, tenant_name, password_hash)
+        with self._lock:
+            plugin = self.plugins.get(key)
+            if plugin is None:
+                plugin = CachedPassword(username=username,
+                                        password=password,
+                                        auth_url=auth_url,
+                                        tenant_name=tenant_name)
+                self.plugins[key] = plugin
+            return plugin
+
+    def clear(self):
+        """Drop all tokens (they can be invalid after snapshot revert)"""
+        with self._lock:
+            for plugin in self.plugins.values():
+                plugin.invalidate()
+            self.plugins.clear()
+
+
+auth_cache = KeystoneAuthCache()
+
+
+def make_http_session():
+    """Return requests session with pooled connections and retries
+
+    Only idempotent requests are retried on 5xx responses.
+    """
+    retries = Retry(total=settings.API_RETRIES,
+                    backoff_factor=settings.API_RETRY_BACKOFF,
+                    status_forcelist=(500, 502, 503, 504),
+                    raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=10,
+                          pool_maxsize=settings.API_POOL_MAXSIZE,
+                          max_retries=retries)
+    http_session = requests.Session()
+    http_session.mount('http://', adapter)
+    http_session.mount('https://', adapter)
+    return http_session
+
+
+# Connections pool shared by all API clients
+http_session = make_http_session()
+
+
+class MetricsSession(session.Session):
+    """Keystone session, which records requests durations to api_metrics"""
+
+    def request(self, url, method, **kwargs):
+        endpoint_filter = kwargs.get('endpoint_filter') or {}
+        service = endpoint_filter.get('service_type')
+        if service is None:
+            service = urlparse.urlsplit(url).netloc
+        start = time.time()
+        errors = 1
+        try:
+            response = super(MetricsSession, self).request(url, method,
+                                                           **kwargs)
+            errors = int(response.status_code >= 400)
+            return response
+        finally:
+            api_metrics.record({'service': service, 'method': method},
+                               time.time() - start, errors=errors)
+
 
 class OpenStackActions(object):
     """OpenStack base services clients and helper actions"""
@@ -49,42 +175,55 @@ class OpenStackActions(object):
         self.tenant = tenant
 
         if cert is None:
-            auth_url = 'http://{0}:5000/v2.0/'.format(self.controller_ip)
+            self.auth_url = 'http://{0}:5000/v2.0/'.format(self.controller_ip)
             self.path_to_cert = None
             self.insecure = True
         else:
-            auth_url = 'https://{0}:5000/v2.0/'.format(self.controller_ip)
-            with gen_temp_file(prefix="fuel_cert_", suffix=".pem") as f:
-                f.write(cert)
-            self.path_to_cert = f.name
+            self.auth_url = 'https://{0}:5000/v2.0/'.format(
+                self.controller_ip)
+            self.path_to_cert = get_cert_file(cert)
             self.insecure = False
 
-        logger.debug('Auth URL is {0}'.format(auth_url))
+        logger.debug('Auth URL is {0}'.format(self.auth_url))
 
-        auth = KeystonePassword(username=user,
-                                password=password,
-                                auth_url=auth_url,
-                                tenant_name=tenant)
+        auth = auth_cache.get(auth_url=self.auth_url,
+                              username=user,
+                              password=password,
+                              tenant_name=tenant)
 
-        self.session = session.Session(auth=auth, verify=self.path_to_cert)
+        self.session = MetricsSession(auth=auth, verify=self.path_to_cert,
+                                      session=http_session)
 
-        self.keystone = KeystoneClient(session=self.session)
-        self.keystone.management_url = auth_url
+        self.env = env
 
-        self.nova = nova_client.Client(version=2, session=self.session)
+    # Clients are created on first use, so creating of OpenStackActions
+    # (after each snapshot revert) makes no requests
 
-        self.cinder = cinderclient.Client(version=2, session=self.session)
+    @cached_property
+    def keystone(self):
+        keystone = KeystoneClient(session=self.session)
+        keystone.management_url = self.auth_url
+        return keystone
 
-        self.neutron = neutron_client.Client(session=self.session)
+    @cached_property
+    def nova(self):
+        return nova_client.Client(version=2, session=self.session)
 
-        self.glance = GlanceClient(session=self.session)
+    @cached_property
+    def cinder(self):
+        return cinderclient.Client(version=2, session=self.session)
 
-        endpoint_url = self.session.get_endpoint(service_type='orchestration',
-                                                 endpoint_type='publicURL')
-        token = self.session.get_token()
-        self.heat = HeatClient(endpoint=endpoint_url, token=token)
+    @cached_property
+    def neutron(self):
+        return neutron_client.Client(session=self.session)
 
-        self.env = env
+    @cached_property
+    def glance(self):
+        return GlanceClient(session=self.session)
+
+    @cached_property
+    def heat(self):
+        return HeatClient(session=self.session, endpoint_type='publicURL')
 
     def _get_cirros_image(self):
         for image in self.glance.images.list():
@@ -146,6 +285,98 @@ class OpenStackActions(object):
             logger.info('the server {0} is ready'.format(srv.name))
         return self.get_instance_detail(srv.id)
 
+    def create_servers(self, specs, concurrency=10, timeout=300,
+                       wait_for_active=True, wait_for_avaliable=True):
+        """Boot many servers at once and wait for them in parallel
+
+        All servers are booted first, then ACTIVE statuses are waited with
+        batched polls (one list call per tick), then ssh availability is
+        checked with `concurrency` workers. If booting or waiting fails,
+        already booted servers are deleted.
+
+        :param specs: list of dicts with `create_server` arguments (`name`
+            is required, `timeout` and `wait_*` flags are ignored)
+        :param concurrency: max count of parallel ssh checks
+        :param timeout: timeout for ACTIVE and for ssh waiting
+        :return: list of servers details in specs order, each has
+            `creation_timings` dict with `boot`, `active` and `ssh` times
+            (in seconds from start of booting)
+        """
+        cirros_image_id = None
+        start = time.time()
+        servers = []
+        timings = []
+        try:
+            for spec in specs:
+                spec = dict(spec)
+                for key in ('timeout', 'wait_for_active',
+                            'wait_for_avaliable'):
+                    spec.pop(key, None)
+                image_id = spec.pop('image_id', None)
+                if image_id is None:
+                    if cirros_image_id is None:
+                        cirros_image_id = self._get_cirros_image().id
+                    image_id = cirros_image_id
+                spec.setdefault('flavor', 1)
+                servers.append(
+                    self.nova.servers.create(image=image_id, **spec))
+                timings.append({'boot': time.time() - start})
+            logger.info('{0} servers are booted in {1:.2f}s'.format(
+                len(servers), time.time() - start))
+
+            if wait_for_active:
+                self._wait_servers_active(servers, timings, start, timeout)
+
+            if wait_for_avaliable and self.env is not None:
+                def wait_ssh(i):
+                    wait(lambda: self.is_server_ssh_ready(servers[i]),
+                         timeout_seconds=timeout,
+                         waiting_for='server {0} available via ssh'.format(
+                             servers[i].name))
+                    timings[i]['ssh'] = time.time() - start
+
+                workers = ThreadPool(
+                    processes=max(1, min(concurrency, len(servers))))
+                try:
+                    workers.map(wait_ssh, range(len(servers)))
+                finally:
+                    workers.close()
+                    workers.join()
+        except Exception:
+            exc_info = sys.exc_info()
+            for server in servers:
+                try:
+                    self.nova.servers.delete(server)
+                except Exception:
+                    logger.warning('Server {0} is not deleted'.format(
+                        server.id), exc_info=True)
+            six.reraise(*exc_info)
+
+        result = []
+        for server, timing in zip(servers, timings):
+            server = self.get_instance_detail(server.id)
+            server.creation_timings = timing
+            logger.info('the server {0} is ready, timings: {1}'.format(
+                server.name, ', '.join('{0} {1:.2f}s'.format(k, v)
+                                       for k, v in sorted(timing.items()))))
+            result.append(server)
+        return result
+
+    def _wait_servers_active(self, servers, timings, start, timeout):
+        search_opts = None
+        # nova filters servers by name regex, use only plain common prefix
+        prefix = re.match(r'\w*', os.path.commonprefix(
+            [x.name for x in servers])).group()
+        if prefix:
+            search_opts = {'name': '^' + prefix}
+        poll_start = time.time() - start
+        waiters = [status_poller.add(self.nova.servers, x.id, 'ACTIVE',
+                                     search_opts=search_opts)
+                   for x in servers]
+        status_poller.wait_all(waiters, timeout=timeout)
+        for waiter, timing in zip(waiters, timings):
+            timing['active'] = poll_start + waiter.duration
+
     def is_server_ssh_ready(self, server):
         """Check ssh connect to server"""
 
@@ -605,16 +836,9 @@ class OpenStackActions(object):
         proxy_commands = []
         for node in proxy_nodes:
             ip = env.find_node_by_fqdn(node).data['ip']
-            key_paths = env.admin_ssh_keys_paths
-            proxy_command = (
-                "ssh {keys} -o 'StrictHostKeyChecking no' "
-                "root@{node_ip} 'ip netns exec {ns} "
-                "nc {vm_ip} 22'".format(
-                    keys=' '.join('-i {}'.format(k) for k in key_paths),
-                    ns=dhcp_namespace,
-                    node_ip=ip,
-                    vm_ip=vm_ip))
-            proxy_commands.append(proxy_command)
+            proxy_commands.append(NetnsTunnel(env.get_ssh_to_node(ip),
+                                              namespace=dhcp_namespace,
+                                              host=vm_ip))
         instance_keys = []
         if vm_keypair is not None:
             instance_keys.append(paramiko.RSAKey.from_private_key(
@@ -12,44 +12,221 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from collections import defaultdict
+from collections import OrderedDict
+from contextlib import contextmanager
 import functools
+import hashlib
 import logging
+from multiprocessing.pool import ThreadPool
 import os
 import paramiko
 import posixpath
+import random
+import re
+import select
+import socket
 import stat
+import tarfile
+import threading
 import time
+import uuid
+
+import six
+from six.moves import shlex_quote
+from six.moves.queue import Empty
+from six.moves.queue import Full
+from six.moves.queue import Queue
+
+from mos_tests import settings
+from mos_tests.functions.stats import Metrics
 
 
 logger = logging.getLogger(__name__)
 
+# Size of single read from ssh channel
+CHUNK_SIZE = 64 * 1024
+
+# Channel window size for file transfers
+TRANSFER_WINDOW_SIZE = 64 * 1024 * 1024
+
+# Smaller files are copied with plain sftp get/put, without resume and
+# remote sha256 check (they cost extra exec round-trips)
+RESUMABLE_TRANSFER_MIN_SIZE = 16 * 1024 * 1024
+
+# Errors, which mean that host is unreachable
+CONNECTION_ERRORS = (socket.error, EOFError, paramiko.SSHException)
+
+# Errors, after which file transfer will be resumed on new connection
+TRANSFER_ERRORS = CONNECTION_ERRORS
+
+# Connect, exec and transfer statistics, grouped by host, operation and
+# command template
+metrics = Metrics()
+
+_COMMAND_TEMPLATE_PATTERNS = (
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "'?'"),
+    (re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-'
+                r'[0-9a-f]{12}', re.I), '<uuid>'),
+    (re.compile(r'\b\d{1,3}(\.\d{1,3}){3}(/\d+)?\b'), '<ip>'),
+    (re.compile(r'\b[0-9a-f]{12,}\b', re.I), '<hex>'),
+    (re.compile(r'\b\d+\b'), '<n>'),
+    (re.compile(r'\s+'), ' '),
+)
+
+
+def command_template(command, max_length=100):
+    """Return command with literals (quoted strings, ids, ips, numbers)
+    replaced by placeholders
+
+    >>> command_template("ping -c 3 10.0.0.5 && echo 'ok'")
+    "ping -c <n> <ip> && echo '?'"
+    """
+    for pattern, replacement in _COMMAND_TEMPLATE_PATTERNS:
+        command = pattern.sub(replacement, command)
+    command = command.strip()
+    if len(command) > max_length:
+        command = command[:max_length - 3] + '...'
+    return command
+
+
+class RetryPolicy(object):
+    """Retry attempts count and delays between them
+
+    Delay grows exponentially: `delay * backoff ** attempt`, but not more
+    than `max_delay`. With `jitter` it is randomly reduced by up to
+    `jitter` part, so simultaneous callers don't retry in lockstep.
+
+    :param count: max attempts count
+    :param delay: delay after first failed attempt (in seconds)
+    :param backoff: delay multiplier
+    :param max_delay: max delay (in seconds)
+    :param jitter: max randomly subtracted part of delay (0..1)
+    :param give_up: exceptions, which should not be retried
+    """
+
+    def __init__(self, count=10, delay=1, backoff=1, max_delay=None,
+                 jitter=0, give_up=()):
+        self.count = count
+        self.delay = delay
+        self.backoff = backoff
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.give_up = give_up
 
-def retry(count=10, delay=1, pass_counter=None):
+    def get_delay(self, attempt):
+        """Return delay after failed attempt (counted from 0)"""
+        delay = self.delay * self.backoff ** attempt
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay * (1 - self.jitter * random.random())
+
+
+def retry(count=10, delay=1, pass_counter=None, policy=None):
     """Retry until no exceptions decorator.
 
     :param pass_counter: argument to pass counter variable in
     :type pass_counter: None or str
+    :param policy: RetryPolicy, `count` and `delay` are ignored if passed
     """
+    if policy is None:
+        policy = RetryPolicy(count=count, delay=delay)
+
     def decorator(func):
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            for i in range(count):
+            for i in range(policy.count):
                 if pass_counter is not None:
                     kwargs[pass_counter] = i
                 try:
                     return func(*args, **kwargs)
+                except policy.give_up:
+                    raise
                 except Exception as e:
-                    time.sleep(delay)
-            else:
-                logger.warning(e)
-                raise
+                    if i == policy.count - 1:
+                        logger.warning(e)
+                        raise
+                    time.sleep(policy.get_delay(i))
 
         return wrapper
 
     return decorator
 
 
+class CircuitOpenError(paramiko.SSHException):
+    """Host is considered unreachable, connection is not tried"""
+
+
+class CircuitBreaker(object):
+    """Per-host connections circuit breaker
+
+    After `threshold` consecutive connection failures circuit for host is
+    opened: connections fail fast with CircuitOpenError. After
+    `reset_timeout` seconds single probe connection is allowed (half-open
+    state): its success closes circuit, its failure opens it again.
+    """
+
+    def __init__(self, threshold=6, reset_timeout=10):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._failures = defaultdict(int)
+        self._opened = {}
+        self._probing = set()
+        self._lock = threading.Lock()
+
+    def before_connect(self, key):
+        """Raise CircuitOpenError if connection to key should not be tried"""
+        with self._lock:
+            opened = self._opened.get(key)
+            if opened is None:
+                return
+            if key in self._probing:
+                raise CircuitOpenError(
+                    'Connection to {0} is being probed'.format(key[0]))
+            if time.time() - opened < self.reset_timeout:
+                raise CircuitOpenError(
+                    '{0} is unreachable ({1} failed connections), next '
+                    'try in {2:.0f}s'.format(
+                        key[0], self._failures[key],
+                        opened + self.reset_timeout - time.time()))
+            self._probing.add(key)
+
+    def success(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+            self._opened.pop(key, None)
+            self._probing.discard(key)
+
+    def failure(self, key):
+        with self._lock:
+            self._failures[key] += 1
+            if key in self._probing or self._failures[key] >= self.threshold:
+                if key not in self._opened:
+                    logger.warning('Circuit to {0} is opened after {1} '
+                                   'failed connections'.format(
+                                       key[0], self._failures[key]))
+                self._opened[key] = time.time()
+            self._probing.discard(key)
+
+    def reset(self, host=None):
+        """Close circuits for host (or all circuits)"""
+        with self._lock:
+            for key in list(self._opened):
+                if host is None or key[0] == host:
+                    del self._opened[key]
+                    self._failures.pop(key, None)
+                    self._probing.discard(key)
+
+
+breaker = CircuitBreaker(threshold=settings.SSH_BREAKER_THRESHOLD,
+                         reset_timeout=settings.SSH_BREAKER_RESET_TIMEOUT)
+
+# Retry policy for establishing ssh connection
+RECONNECT_POLICY = RetryPolicy(count=3, delay=1, backoff=3, max_delay=10,
+                               jitter=0.5, give_up=CircuitOpenError)
+
+
 class CalledProcessError(Exception):
     def __init__(self, command, returncode, output=None):
         self.returncode = returncode
@@ -64,14 +241,99 @@ class CalledProcessError(Exception):
         return message
 
 
+class CommandTimeoutError(Exception):
+    def __init__(self, command, timeout):
+        self.cmd = command
+        self.timeout = timeout
+
+    def __str__(self):
+        return "Command '%s' timed out after %s seconds" % (self.cmd,
+                                                            self.timeout)
+
+
 class CommandResult(dict):
+    """Command execution result
+
+    Dict with `stdout`, `stderr` (lists of output lines) and `exit_code`
+    keys. Result created with `from_output` also keeps whole output as
+    bytes: `get_bytes`, `memoryview` and `iter_lines` use it without
+    joining lines, `stdout_string`/`stderr_string` are decoded only once.
+    Raw bytes are used only while the key holds its original lines list.
+    """
+
+    __slots__ = ('_raw', '_decoded', 'host', 'duration', 'error')
+
+    def __init__(self, *args, **kwargs):
+        super(CommandResult, self).__init__(*args, **kwargs)
+        self._raw = {}
+        self._decoded = {}
+        self.host = None
+        self.duration = None
+        self.error = None
+
+    @classmethod
+    def from_output(cls, stdout, stderr, exit_code):
+        """Make result from raw stdout and stderr bytes"""
+        result = cls(exit_code=exit_code)
+        # lines are real dict values, so dict(result) and **result work
+        for key, data in (('stdout', stdout), ('stderr', stderr)):
+            lines = data.splitlines(True)
+            dict.__setitem__(result, key, lines)
+            result._raw[key] = (lines, data)
+        return result
+
+    def _get_raw(self, key):
+        lines, data = self._raw.get(key, (None, None))
+        if lines is not None and dict.get(self, key) is lines:
+            return data
+
+    def __reduce__(self):
+        # dict subclass with slots is not picklable by default
+        state = {'host': self.host, 'duration': self.duration,
+                 'error': self.error}
+        return self.__class__, (dict.copy(self),), state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
 
     @property
     def is_ok(self):
         return self['exit_code'] == 0
 
+    def get_bytes(self, key='stdout'):
+        """Return whole output as bytes (without copying, if possible)"""
+        data = self._get_raw(key)
+        if data is None:
+            data = b''.join(self[key])
+        return data
+
+    def memoryview(self, key='stdout'):
+        """Return memoryview of output (without copying of it)"""
+        return memoryview(self.get_bytes(key))
+
+    def iter_lines(self, key='stdout', encoding='utf-8'):
+        """Yield output lines (without line endings) one by one
+
+        :param encoding: lines encoding, bytes are yielded if it's None
+        """
+        data = self.get_bytes(key)
+        start = 0
+        while start < len(data):
+            end = data.find(b'\n', start)
+            if end == -1:
+                end = len(data)
+            line = data[start:end].rstrip(b'\r')
+            start = end + 1
+            yield line if encoding is None else line.decode(encoding)
+
     def _list_to_string(self, key):
-        return (''.join(self[key])).decode('utf-8').strip()
+        data = self._get_raw(key)
+        if data is None:
+            return self.get_bytes(key).decode('utf-8').strip()
+        if key not in self._decoded:
+            self._decoded[key] = data.decode('utf-8').strip()
+        return self._decoded[key]
 
     @property
     def stdout_string(self):
@@ -82,6 +344,527 @@ class CommandResult(dict):
         return self._list_to_string('stderr')
 
 
+_spill_lock = threading.Lock()
+
+
+def output_artifact_path():
+    """Return path of file for full commands output of current test"""
+    # PYTEST_CURRENT_TEST looks like "path::test_name[params] (stage)"
+    test = os.environ.get('PYTEST_CURRENT_TEST', 'session')
+    test = test.rsplit(' (', 1)[0]
+    name = re.sub(r'[^\w.-]+', '_', test).strip('_')
+    return os.path.join(settings.COMMAND_OUTPUT_DIR, name + '.log')
+
+
+def spill_output(command, output):
+    """Append command output (bytes) to current test artifact file
+
+    :return: path to file
+    """
+    path = output_artifact_path()
+    with _spill_lock:
+        if not os.path.isdir(settings.COMMAND_OUTPUT_DIR):
+            os.makedirs(settings.COMMAND_OUTPUT_DIR)
+        with open(path, 'ab') as f:
+            f.write(u'==> {0} <==\n'.format(command).encode('utf-8'))
+            f.write(output)
+            f.write(b'\n')
+    return path
+
+
+@six.python_2_unicode_compatible
+class OutputSummary(object):
+    """Lazy log representation of command output
+
+    Usage:
+
+        logger.debug(u'Stdout:\n%s', OutputSummary(command, stdout))
+
+    Output is formatted only when log record is emitted. Only `lines` first
+    and `lines` last lines of long output are shown, full output is spilled
+    to current test artifact file (see `spill_output`).
+
+    :param command: executed command
+    :param output: command output (bytes)
+    :param lines: count of head and tail lines to show
+    """
+
+    def __init__(self, command, output, lines=None):
+        self.command = command
+        self.output = output
+        if lines is None:
+            lines = settings.COMMAND_OUTPUT_LOG_LINES
+        self.lines = lines
+        self._text = None
+
+    def _format(self):
+        output = self.output.rstrip()
+        total = output.count(b'\n') + 1
+        if total <= 2 * self.lines:
+            return output.decode('utf-8', 'replace')
+        head_end = -1
+        for _ in range(self.lines):
+            head_end = output.find(b'\n', head_end + 1)
+        tail_start = len(output)
+        for _ in range(self.lines):
+            tail_start = output.rfind(b'\n', 0, tail_start)
+        try:
+            path = spill_output(self.command, self.output)
+        except (IOError, OSError) as e:
+            path = 'nowhere ({})'.format(e)
+        template = u'{0}\n... {1} lines skipped, full output is in {2} ...{3}'
+        return template.format(
+            output[:max(head_end, 0)].decode('utf-8', 'replace'),
+            total - 2 * self.lines, path,
+            output[tail_start:].decode('utf-8', 'replace'))
+
+    def __str__(self):
+        if self._text is None:
+            self._text = self._format()
+        return self._text
+
+
+class TransferError(Exception):
+    pass
+
+
+class TransferStats(object):
+    """Statistics of single file transfer"""
+
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self.size = 0
+        self.transferred = 0
+        self.resumed_from = 0
+        self.retries = 0
+        self.duration = 0
+        self.sha256 = None
+
+    @property
+    def throughput(self):
+        """Transfer speed in bytes per second"""
+        if self.duration:
+            return self.transferred / self.duration
+        return 0
+
+    def __str__(self):
+        return ("'{0.source}' -> '{0.target}': {0.transferred} of {0.size} "
+                "bytes in {0.duration:.1f}s ({1:.2f} MB/s), resumed from "
+                "{0.resumed_from}, retries {0.retries}").format(
+                    self, self.throughput / 1024 ** 2)
+
+
+def read_channel(chan, poll_timeout=1, timeout=None):
+    """Read all command output from channel until it exits
+
+    Blocks on the channel with select instead of busy polling, collects
+    received chunks to lists and joins them once at the end.
+
+    :param chan: paramiko channel with executed command
+    :param poll_timeout: max time (in seconds) to block in a single select
+    :param timeout: max command execution time. Channel will be closed and
+        CommandTimeoutError raised after it
+    :return: tuple (stdout, stderr, exit_code)
+    """
+    stdout = []
+    stderr = []
+    deadline = None if timeout is None else time.time() + timeout
+
+    def drain():
+        while chan.recv_ready():
+            stdout.append(chan.recv(CHUNK_SIZE))
+        while chan.recv_stderr_ready():
+            stderr.append(chan.recv_stderr(CHUNK_SIZE))
+
+    while not (chan.eof_received or chan.closed):
+        if deadline is not None and time.time() > deadline:
+            chan.close()
+            raise CommandTimeoutError(None, timeout)
+        select.select([chan], [], [], poll_timeout)
+        drain()
+    exit_code = chan.recv_exit_status()
+    drain()
+    return b''.join(stdout), b''.join(stderr), exit_code
+
+
+class CommandStream(object):
+    """Lines of remote command output, which is running in background
+
+    Output is read by separate thread into a bounded buffer. When buffer is
+    full, reading from channel stops, so remote command is slowed down by
+    ssh flow control instead of accumulating output in memory.
+
+    :param chan: paramiko channel with executed command
+    :param buffer_lines: max count of not consumed lines
+    :param max_line_length: lines longer than this will be split
+    """
+
+    _EOF = object()
+
+    def __init__(self, chan, buffer_lines=1000, max_line_length=64 * 1024,
+                 encoding='utf-8'):
+        self.chan = chan
+        self.encoding = encoding
+        self.max_line_length = max_line_length
+        self._lines = Queue(maxsize=buffer_lines)
+        self._stopped = threading.Event()
+        self._reader = threading.Thread(target=self._read)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _put(self, line):
+        while not self._stopped.is_set():
+            try:
+                self._lines.put(line, timeout=0.5)
+                return
+            except Full:
+                continue
+
+    def _read(self):
+        partial = b''
+        while True:
+            try:
+                chunk = self.chan.recv(CHUNK_SIZE)
+            except Exception:
+                logger.exception('Error during reading command output')
+                break
+            if not chunk:
+                break
+            lines = (partial + chunk).split(b'\n')
+            partial = lines.pop()
+            while len(partial) > self.max_line_length:
+                lines.append(partial[:self.max_line_length])
+                partial = partial[self.max_line_length:]
+            for line in lines:
+                self._put(line)
+        if partial:
+            self._put(partial)
+        self._put(self._EOF)
+
+    def iter_lines(self, timeout=None):
+        """Yield decoded output lines (without line endings) as they arrive
+
+        :param timeout: max time to wait for a next line
+        :raises: Exception if there is no new line during `timeout`
+        """
+        while True:
+            try:
+                line = self._lines.get(timeout=timeout)
+            except Empty:
+                self.terminate()
+                raise Exception('Timeout was reached during waiting for '
+                                'command output')
+            if line is self._EOF:
+                return
+            yield line.decode(self.encoding, 'replace').rstrip(u'\r')
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    @property
+    def exit_code(self):
+        """Command exit code or None, if command is still running"""
+        if self.chan.exit_status_ready():
+            return self.chan.recv_exit_status()
+
+    def wait(self, timeout=None):
+        """Wait for command to finish
+
+        :return: True if command finished during `timeout`, False otherwise
+        """
+        return self.chan.status_event.wait(timeout) or self.chan.closed
+
+    def interrupt(self):
+        """Send SIGINT to command (works only for commands with pty)"""
+        if not self.chan.closed:
+            self.chan.send(b'\x03')
+
+    def terminate(self):
+        """Close channel and stop reading output"""
+        self._stopped.set()
+        self.chan.close()
+
+
+class SSHConnectionPool(object):
+    """Process-wide pool of established ssh connections.
+
+    Connections are keyed by (host, port, username, proxy commands). Idle
+    connections are checked with a keepalive round-trip (at most
+    `ping_timeout` seconds) before reuse and evicted after `idle_ttl`
+    seconds.
+    """
+
+    def __init__(self, idle_ttl=300, ping_timeout=5):
+        self.idle_ttl = idle_ttl
+        self.ping_timeout = ping_timeout
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _is_alive(ssh):
+        transport = ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _ping(self, ssh):
+        """Check connection with keepalive request and wait for reply
+
+        paramiko waits for global request reply without timeout, so it is
+        sent from separate thread. Hung connection is closed by caller,
+        that stops the thread.
+        """
+        if not self._is_alive(ssh):
+            return False
+        transport = ssh.get_transport()
+
+        def request():
+            try:
+                transport.global_request('keepalive@openssh.com', wait=True)
+            except Exception:
+                pass
+
+        thread = threading.Thread(target=request, name='ssh-keepalive')
+        thread.daemon = True
+        thread.start()
+        thread.join(self.ping_timeout)
+        return not thread.is_alive() and transport.is_active()
+
+    @staticmethod
+    def _close(ssh, proxy):
+        for connection in (ssh, proxy):
+            if connection is None:
+                continue
+            try:
+                connection.close()
+            except Exception:
+                logger.exception("Could not close pooled connection")
+
+    def _pop_expired(self):
+        """Remove expired connections from pool and return them
+
+        Must be called with acquired lock.
+        """
+        expired = []
+        deadline = time.time() - self.idle_ttl
+        for key in list(self._idle):
+            connections = self._idle[key]
+            expired.extend(x for x in connections if x[2] < deadline)
+            connections[:] = [x for x in connections if x[2] >= deadline]
+            if not connections:
+                del self._idle[key]
+        return expired
+
+    def lease(self, key):
+        """Return alive (ssh, proxy) pair for key or None if pool is empty"""
+        while True:
+            with self._lock:
+                expired = self._pop_expired()
+                connections = self._idle.get(key)
+                entry = connections.pop() if connections else None
+            for ssh, proxy, _ in expired:
+                self._close(ssh, proxy)
+            if entry is None:
+                return None
+            ssh, proxy, _ = entry
+            if self._ping(ssh):
+                logger.debug('Reuse pooled ssh connection to %s', key[0])
+                return ssh, proxy
+            logger.debug('Pooled ssh connection to %s is dead', key[0])
+            self._close(ssh, proxy)
+
+    def release(self, key, ssh, proxy=None):
+        """Return connection to pool"""
+        if not self._is_alive(ssh):
+            self._close(ssh, proxy)
+            return
+        with self._lock:
+            self._idle[key].append((ssh, proxy, time.time()))
+            expired = self._pop_expired()
+        for ssh, proxy, _ in expired:
+            self._close(ssh, proxy)
+
+    def discard(self, host=None):
+        """Close idle connections to host (or all connections)"""
+        with self._lock:
+            keys = [x for x in self._idle if host is None or x[0] == host]
+            connections = [y for x in keys for y in self._idle.pop(x)]
+        for ssh, proxy, _ in connections:
+            self._close(ssh, proxy)
+
+    def clear(self):
+        self.discard()
+
+
+pool = SSHConnectionPool(idle_ttl=settings.SSH_POOL_IDLE_TTL,
+                         ping_timeout=settings.SSH_POOL_PING_TIMEOUT)
+
+
+class NetnsTunnel(object):
+    """Forwarding channel to host:port inside network namespace of node
+
+    Can be passed to `SSHClient` in `proxy_commands` instead of
+    `ssh root@node 'ip netns exec ns nc host port'` command: channel is
+    opened over connection to node kept by `TunnelManager`, so neither
+    local ssh process nor extra handshake is needed for each connection.
+
+    :param remote: SSHClient to node with namespace
+    :param namespace: network namespace name (qdhcp-<net_id>)
+    :param host: destination address
+    :param port: destination port
+    """
+
+    command = 'ip netns exec {namespace} nc {host} {port}'
+
+    def __init__(self, remote, namespace, host, port=22):
+        self.remote = remote
+        self.namespace = namespace
+        self.host = host
+        self.port = int(port)
+
+    @property
+    def key(self):
+        return self.remote.pool_key, self.namespace, self.host, self.port
+
+    def __eq__(self, other):
+        return isinstance(other, NetnsTunnel) and self.key == other.key
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __str__(self):
+        return '{0} (on {1})'.format(
+            self.command.format(namespace=self.namespace, host=self.host,
+                                port=self.port),
+            self.remote.host)
+
+    def __call__(self):
+        return tunnels.open_channel(self)
+
+
+class TunnelManager(object):
+    """Keeps one connection per node for `NetnsTunnel` channels"""
+
+    def __init__(self):
+        self._remotes = {}
+        self._lock = threading.Lock()
+
+    def _get_remote(self, remote):
+        key = remote.pool_key
+        with self._lock:
+            connected = self._remotes.get(key)
+            if connected is not None:
+                ssh = connected._ssh
+                if ssh is not None and pool._is_alive(ssh):
+                    return connected
+                connected.clear()
+            self._remotes[key] = remote.__enter__()
+            return remote
+
+    def open_channel(self, tunnel):
+        """Open forwarding channel for tunnel
+
+        :returns: paramiko.Channel, which can be used as socket
+        """
+        remote = self._get_remote(tunnel.remote)
+        command = tunnel.command.format(
+            namespace=shlex_quote(tunnel.namespace),
+            host=shlex_quote(tunnel.host),
+            port=tunnel.port)
+        chan = remote._ssh.get_transport().open_session()
+        chan.exec_command(command)
+        return chan
+
+    def discard(self, host=None):
+        """Close connections to node with host (or all connections)"""
+        with self._lock:
+            keys = [x for x in self._remotes if host is None or x[0] == host]
+            remotes = [self._remotes.pop(x) for x in keys]
+        for remote in remotes:
+            remote.clear()
+
+    def clear(self):
+        self.discard()
+
+
+tunnels = TunnelManager()
+
+
+class RemoteFactCache(object):
+    """TTL cache for results of idempotent commands (remote facts)
+
+    Results are keyed by (host, command). Only successful results are
+    cached. Connection to host is established only on cache miss.
+
+    :param ttl: default lifetime of cached result (in seconds)
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._facts = {}
+        self._lock = threading.Lock()
+
+    def execute(self, remote, command, ttl=None):
+        """Return cached result of command or execute it on remote
+
+        :param remote: not connected SSHClient
+        :param ttl: lifetime of result, default is `self.ttl`
+        """
+        if ttl is None:
+            ttl = self.ttl
+        key = (remote.host, command)
+        with self._lock:
+            created, result = self._facts.get(key, (0, None))
+            if result is not None and time.time() - created < ttl:
+                self.hits += 1
+                return result
+            self.misses += 1
+        with remote:
+            result = remote.execute(command)
+        if result.is_ok:
+            with self._lock:
+                self._facts[key] = (time.time(), result)
+        return result
+
+    def check_call(self, remote, command, ttl=None):
+        result = self.execute(remote, command, ttl=ttl)
+        if not result.is_ok:
+            raise CalledProcessError(command, result['exit_code'],
+                                     result['stdout'] + result['stderr'])
+        return result
+
+    def invalidate(self, host=None, command=None):
+        """Drop cached results for host and/or command (or all results)"""
+        with self._lock:
+            for key in list(self._facts):
+                if host is not None and key[0] != host:
+                    continue
+                if command is not None and key[1] != command:
+                    continue
+                del self._facts[key]
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._facts)}
+
+
+facts = RemoteFactCache(ttl=settings.REMOTE_FACTS_TTL)
+
+
 class SSHClient(object):
 
     def __repr__(self):
@@ -105,7 +888,8 @@ class SSHClient(object):
             self.ssh.sudo_mode = False
 
     def __init__(self, host, port=22, username=None, password=None,
-                 private_keys=None, proxy_commands=(), timeout=120):
+                 private_keys=None, proxy_commands=(), timeout=120,
+                 use_pool=True):
         self.host = str(host)
         self.port = int(port)
         self.username = username
@@ -118,16 +902,26 @@ class SSHClient(object):
         self.sudo = self.get_sudo(self)
         self.timeout = timeout
         self.proxy_commands = proxy_commands
+        self.use_pool = use_pool
         self._ssh = None
         self._sftp_client = None
         self._proxy = None
 
-    def clear(self):
+    @property
+    def pool_key(self):
+        return (self.host, self.port, self.username,
+                tuple(self.proxy_commands))
+
+    def _close_sftp(self):
         if self._sftp_client is not None:
             try:
                 self._sftp_client.close()
             except Exception:
                 logger.exception("Could not close sftp connection")
+        self._sftp_client = None
+
+    def clear(self):
+        self._close_sftp()
 
         if self._ssh is not None:
             try:
@@ -145,6 +939,13 @@ class SSHClient(object):
         self.clear()
 
     def __enter__(self):
+        leased = None
+        if self.use_pool:
+            leased = pool.lease(self.pool_key)
+        if leased is not None:
+            self.clear()
+            self._ssh, self._proxy = leased
+            return self
         try:
             self.reconnect()
         except Exception:
@@ -153,7 +954,13 @@ class SSHClient(object):
         return self
 
     def __exit__(self, *err):
-        self.clear()
+        if not self.use_pool or self._ssh is None:
+            self.clear()
+            return
+        self._close_sftp()
+        pool.release(self.pool_key, self._ssh, self._proxy)
+        self._ssh = None
+        self._proxy = None
 
     def connect(self):
         logger.debug(
@@ -178,18 +985,39 @@ class SSHClient(object):
 
         return self._ssh.connect(self.host, **base_kwargs)
 
-    @retry(count=3, delay=3, pass_counter='counter')
+    @retry(policy=RECONNECT_POLICY, pass_counter='counter')
     def reconnect(self, counter):
         self.clear()
+        breaker.before_connect(self.pool_key)
         self._ssh = paramiko.SSHClient()
         self._ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        proxies_count = len(self.proxy_commands)
-        if proxies_count > 0:
-            proxy_command = self.proxy_commands[counter % proxies_count]
-            logger.debug('Proxy command for ssh: "{0}"'.format(proxy_command))
-            self._proxy = paramiko.ProxyCommand(proxy_command)
-            self._proxy.settimeout(self.timeout)
-        self.connect()
+        start = time.time()
+        tags = {'host': self.host, 'operation': 'connect', 'command': ''}
+        try:
+            proxies_count = len(self.proxy_commands)
+            if proxies_count > 0:
+                proxy_command = self.proxy_commands[counter % proxies_count]
+                logger.debug(
+                    'Proxy command for ssh: "{0}"'.format(proxy_command))
+                if callable(proxy_command):
+                    self._proxy = proxy_command()
+                else:
+                    self._proxy = paramiko.ProxyCommand(proxy_command)
+                self._proxy.settimeout(self.timeout)
+            self.connect()
+        except Exception as e:
+            metrics.record(tags, time.time() - start, errors=1,
+                           retries=int(counter > 0))
+            # authentication errors mean that host is alive
+            if isinstance(e, CONNECTION_ERRORS) and not isinstance(
+                    e, paramiko.AuthenticationException):
+                breaker.failure(self.pool_key)
+            else:
+                breaker.success(self.pool_key)
+            raise
+        breaker.success(self.pool_key)
+        metrics.record(tags, time.time() - start, errors=0,
+                       retries=int(counter > 0))
 
     def check_call(self, command, verbose=True):
         ret = self.execute(command, verbose)
@@ -223,43 +1051,70 @@ class SSHClient(object):
         if errors:
             raise CalledProcessError(command, errors)
 
-    def execute(self, command, verbose=True, merge_stderr=False):
+    def execute(self, command, verbose=True, merge_stderr=False,
+                timeout=None):
+        start = time.time()
+        tags = {'host': self.host, 'operation': 'exec',
+                'command': command_template(command)}
         chan, stdin, stdout, stderr = self.execute_async(
             command, merge_stderr=merge_stderr)
-        output = {'stdout': '', 'stderr': ''}
-
-        def read_from_chan():
-            while chan.recv_ready():
-                output['stdout'] += chan.recv(1024)
-            while chan.recv_stderr_ready():
-                output['stderr'] += chan.recv_stderr(1024)
-
-        while not chan.exit_status_ready():
-            read_from_chan()
-
-        read_from_chan()
-        result = CommandResult({
-            'stdout': output['stdout'].splitlines(True),
-            'stderr': output['stderr'].splitlines(True),
-            'exit_code': chan.recv_exit_status()
-        })
+        try:
+            out, err, exit_code = read_channel(chan, timeout=timeout)
+        except CommandTimeoutError as e:
+            e.cmd = command
+            metrics.record(tags, time.time() - start, errors=1,
+                           bytes_out=len(command))
+            raise
+        metrics.record(tags, time.time() - start, errors=int(exit_code != 0),
+                       bytes_out=len(command), bytes_in=len(out) + len(err))
+        result = CommandResult.from_output(out, err, exit_code)
         stdin.close()
         stdout.close()
         stderr.close()
         chan.close()
-        if verbose:
-            logger.debug("'{0}' exit_code is {1}".format(
-                command, result['exit_code']))
-            if len(result['stdout']) > 0:
-                logger.debug(u'Stdout:\n{0}'.format(result.stdout_string))
-            if len(result['stderr']) > 0:
-                logger.debug(u'Stderr:\n{0}'.format(result.stderr_string))
+        if verbose and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("'%s' exit_code is %s", command, exit_code)
+            if out:
+                logger.debug(u'Stdout:\n%s', OutputSummary(command, out))
+            if err:
+                logger.debug(u'Stderr:\n%s', OutputSummary(command, err))
         return result
 
-    def execute_async(self, command, merge_stderr=False):
+    @contextmanager
+    def stream(self, command, get_pty=True, buffer_lines=1000):
+        """Execute command and yield CommandStream with it output
+
+        Channel is closed on exit (SIGHUP will be sent to command with pty).
+
+        Usage:
+
+            with remote.stream('ping 8.8.8.8') as ping:
+                for line in ping.iter_lines(timeout=60):
+                    ...
+                    if enough:
+                        ping.interrupt()
+
+        Stderr is merged to stdout, otherwise nobody reads it and command
+        blocks when stderr window is full.
+
+        :param get_pty: request pseudo-terminal. It allows to send SIGINT
+            to command
+        :param buffer_lines: max count of received but not consumed lines
+        """
+        chan, _, _, _ = self.execute_async(command, merge_stderr=True,
+                                           get_pty=get_pty)
+        stream = CommandStream(chan, buffer_lines=buffer_lines)
+        try:
+            yield stream
+        finally:
+            stream.terminate()
+
+    def execute_async(self, command, merge_stderr=False, get_pty=False):
         logger.debug("Executing command: '%s'" % command.rstrip())
         chan = self._ssh.get_transport().open_session(timeout=self.timeout)
         chan.set_combine_stderr(merge_stderr)
+        if get_pty:
+            chan.get_pty()
         stdin = chan.makefile('wb')
         stdout = chan.makefile('rb')
         stderr = chan.makefile_stderr('rb')
@@ -287,7 +1142,15 @@ class SSHClient(object):
     def open(self, path, mode='r'):
         return self._sftp.open(path, mode)
 
-    def upload(self, source, target):
+    def upload(self, source, target, use_tar=True):
+        """Copy local file or directory to remote host
+
+        Large files are uploaded with resume and checksum verification
+        (see `upload_file`). Directories are streamed as tar archive
+        through single exec channel. If remote tar fails (or `use_tar` is
+        False) directory is copied with sftp, skipping files with same size
+        and mtime.
+        """
         logger.debug("Copying '%s' -> '%s'", source, target)
 
         if self.isdir(target):
@@ -295,23 +1158,72 @@ class SSHClient(object):
 
         source = os.path.expanduser(source)
         if not os.path.isdir(source):
-            self._sftp.put(source, target)
+            if os.path.getsize(source) < RESUMABLE_TRANSFER_MIN_SIZE:
+                self._sftp.put(source, target)
+            else:
+                self.upload_file(source, target)
             return
 
-        for rootdir, subdirs, files in os.walk(source):
+        if use_tar:
+            if self._upload_tar(source, target):
+                return
+            logger.warning("Can't upload '%s' with tar, fallback to sftp",
+                           source)
+        self._upload_sftp(source, target)
+
+    def _upload_tar(self, source, target):
+        """Stream local directory content to target as tar archive
+
+        :return: True on success, False otherwise
+        """
+        command = 'mkdir -p {0} && tar --no-same-owner -x -C {0}'.format(
+            shlex_quote(target))
+        chan, stdin, stdout, stderr = self.execute_async(command)
+        try:
+            archive = tarfile.open(fileobj=stdin, mode='w|')
+            archive.add(source, arcname='.')
+            archive.close()
+            stdin.flush()
+            chan.shutdown_write()
+        except Exception as e:
+            logger.debug("Error during tar streaming: {}".format(e))
+        _, err, exit_code = read_channel(chan)
+        chan.close()
+        if exit_code != 0:
+            logger.debug("'{0}' exit_code is {1}: {2}".format(
+                command, exit_code, err))
+        return exit_code == 0
+
+    def _upload_sftp(self, source, target):
+        """Copy directory with sftp, skipping files which are up to date"""
+        tree = []
+        for rootdir, _, files in os.walk(source):
             targetdir = os.path.normpath(
                 os.path.join(
                     target,
                     os.path.relpath(rootdir, source))).replace("\\", "/")
+            tree.append((rootdir, targetdir, files))
 
-            self.mkdir(targetdir)
+        self.execute('mkdir -p {}'.format(
+            ' '.join(shlex_quote(x[1]) for x in tree)), verbose=False)
 
+        for rootdir, targetdir, files in tree:
+            existing = {x.filename: x for x in
+                        self._sftp.listdir_attr(targetdir)}
             for entry in files:
                 local_path = os.path.join(rootdir, entry)
                 remote_path = posixpath.join(targetdir, entry)
-                if self.exists(remote_path):
+                local_stat = os.stat(local_path)
+                attrs = existing.get(entry)
+                if attrs is not None:
+                    is_same = (attrs.st_size, attrs.st_mtime) == (
+                        local_stat.st_size, int(local_stat.st_mtime))
+                    if is_same:
+                        continue
                     self._sftp.unlink(remote_path)
-                self._sftp.put(local_path, remote_path)
+                self._sftp.put(local_path, remote_path, confirm=False)
+                self._sftp.utime(remote_path, (int(local_stat.st_atime),
+                                               int(local_stat.st_mtime)))
 
     def download(self, destination, target):
         logger.debug(
@@ -324,7 +1236,11 @@ class SSHClient(object):
 
         if not self.isdir(destination):
             if self.exists(destination):
-                self._sftp.get(destination, target)
+                size = self._sftp.stat(destination).st_size
+                if size < RESUMABLE_TRANSFER_MIN_SIZE:
+                    self._sftp.get(destination, target)
+                else:
+                    self.download_file(destination, target)
             else:
                 logger.debug(
                     "Can't download %s because it doesn't exist", destination
@@ -335,6 +1251,177 @@ class SSHClient(object):
             )
         return os.path.exists(target)
 
+    def _open_transfer_sftp(self):
+        """Open sftp session with large channel window for file transfer"""
+        return paramiko.SFTPClient.from_transport(
+            self._ssh.get_transport(), window_size=TRANSFER_WINDOW_SIZE)
+
+    def remote_sha256(self, path, size=None):
+        """Return sha256 hex digest of remote file (or of first `size` bytes)
+
+        :return: digest or None if it can't be calculated on remote host
+        """
+        if size is None:
+            command = 'sha256sum {}'.format(shlex_quote(path))
+        else:
+            command = 'head -c {0} {1} | sha256sum'.format(
+                size, shlex_quote(path))
+        result = self.execute(command, verbose=False)
+        if not result.is_ok or not result['stdout']:
+            logger.warning("Can't calculate sha256 of remote '{0}': "
+                           "{1}".format(path, result['stderr']))
+            return None
+        return result.stdout_string.split()[0]
+
+    @staticmethod
+    def _local_sha256(path, size):
+        """Return hash object for first `size` bytes of local file"""
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            while size > 0:
+                chunk = f.read(min(CHUNK_SIZE, size))
+                if not chunk:
+                    break
+                sha.update(chunk)
+                size -= len(chunk)
+        return sha
+
+    def _verified_offset(self, local_path, remote_path, size):
+        """Return (offset, sha) to resume transfer of partially copied file
+
+        Offset is `size` if first `size` bytes of local and remote files are
+        equal and 0 otherwise.
+        """
+        if size > 0:
+            sha = self._local_sha256(local_path, size)
+            if sha.hexdigest() == self.remote_sha256(remote_path, size):
+                return size, sha
+        return 0, hashlib.sha256()
+
+    def _verify_transfer(self, stats, remote_path):
+        remote_sha = self.remote_sha256(remote_path)
+        if remote_sha is not None and remote_sha != stats.sha256:
+            raise TransferError("Checksum mismatch for {0}: {1} != {2}".format(
+                stats, stats.sha256, remote_sha))
+
+    def _transfer(self, operation, stats, copy, max_retries):
+        start = time.time()
+        while True:
+            try:
+                copy()
+                break
+            except TRANSFER_ERRORS as e:
+                stats.retries += 1
+                if stats.retries > max_retries:
+                    raise
+                logger.warning('Transfer {0} is interrupted: {1}. '
+                               'Reconnecting...'.format(stats, e))
+                self.reconnect()
+        stats.duration = time.time() - start
+        counter = 'bytes_in' if operation == 'download' else 'bytes_out'
+        metrics.record({'host': self.host, 'operation': operation,
+                        'command': ''},
+                       stats.duration, retries=stats.retries,
+                       **{counter: stats.transferred})
+
+    def download_file(self, source, target, max_retries=5):
+        """Download single file with resume and sha256 verification
+
+        File is downloaded to `target`.part first. If it already exists and
+        matches beginning of remote file, download will be continued from
+        it. After connection failures download is resumed after reconnect.
+
+        :return: TransferStats
+        """
+        stats = TransferStats(source, target)
+        part = target + '.part'
+        size = os.path.getsize(part) if os.path.exists(part) else 0
+        progress = {}
+        progress['offset'], progress['sha'] = self._verified_offset(
+            part, source, size)
+        stats.resumed_from = progress['offset']
+
+        def copy():
+            sftp = self._open_transfer_sftp()
+            try:
+                with sftp.open(source, 'rb') as remote_file:
+                    stats.size = remote_file.stat().st_size
+                    mode = 'r+b' if progress['offset'] else 'wb'
+                    with open(part, mode) as f:
+                        f.seek(progress['offset'])
+                        f.truncate()
+                        remote_file.seek(progress['offset'])
+                        remote_file.prefetch()
+                        while True:
+                            chunk = remote_file.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                            progress['sha'].update(chunk)
+                            progress['offset'] += len(chunk)
+                            stats.transferred += len(chunk)
+            finally:
+                sftp.close()
+
+        self._transfer('download', stats, copy, max_retries)
+        stats.sha256 = progress['sha'].hexdigest()
+        self._verify_transfer(stats, source)
+        os.rename(part, target)
+        logger.info('Downloaded {}'.format(stats))
+        return stats
+
+    def upload_file(self, source, target, max_retries=5):
+        """Upload single file with resume and sha256 verification
+
+        File is uploaded to `target`.part first. After connection failures
+        upload is resumed from last verified offset after reconnect.
+
+        :return: TransferStats
+        """
+        stats = TransferStats(source, target)
+        stats.size = os.path.getsize(source)
+        part = target + '.part'
+        progress = {'offset': 0, 'sha': hashlib.sha256()}
+
+        def copy():
+            sftp = self._open_transfer_sftp()
+            try:
+                try:
+                    size = sftp.stat(part).st_size
+                except IOError:
+                    size = 0
+                progress['offset'], progress['sha'] = self._verified_offset(
+                    source, part, min(size, stats.size))
+                if stats.retries == 0:
+                    stats.resumed_from = progress['offset']
+                mode = 'r+b' if progress['offset'] else 'wb'
+                with sftp.open(part, mode) as remote_file, \
+                        open(source, 'rb') as f:
+                    remote_file.set_pipelined(True)
+                    if size > progress['offset'] > 0:
+                        remote_file.truncate(progress['offset'])
+                    remote_file.seek(progress['offset'])
+                    f.seek(progress['offset'])
+                    while True:
+                        chunk = f.read(CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        remote_file.write(chunk)
+                        progress['sha'].update(chunk)
+                        progress['offset'] += len(chunk)
+                        stats.transferred += len(chunk)
+            finally:
+                sftp.close()
+
+        self._transfer('upload', stats, copy, max_retries)
+        stats.sha256 = progress['sha'].hexdigest()
+        self._verify_transfer(stats, part)
+        self.check_call('mv -f {0} {1}'.format(shlex_quote(part),
+                                               shlex_quote(target)),
+                        verbose=False)
+        logger.info('Uploaded {}'.format(stats))
+        return stats
+
     def exists(self, path):
         try:
             self._sftp.lstat(path)
@@ -359,3 +1446,224 @@ class SSHClient(object):
 
 def ssh(*args, **kwargs):
     return SSHClient(*args, **kwargs)
+
+
+class PersistentShell(object):
+    """Long-lived remote shell for sequential commands execution
+
+    Commands are written to stdin of single shell process on one channel.
+    End of each command output is detected by random marker, which is
+    printed to stdout (with exit code) and stderr after command. So
+    channel setup, shell startup and `init` command (like `. openrc`) are
+    paid only once.
+
+    Each command is executed in subshell with stdin from /dev/null, so it
+    can't consume next commands or change shell state.
+
+    Usage:
+
+        shell = PersistentShell(remote, init='. openrc')
+        result = shell.execute('nova list')
+        shell.close()
+
+    :param remote: connected SSHClient
+    :param init: command to execute in shell once after start
+    """
+
+    def __init__(self, remote, init=None, shell='bash --norc --noprofile'):
+        self.remote = remote
+        self.init = init
+        self.shell = shell
+        self.chan = None
+        self._marker = 'END-OF-COMMAND-{}'.format(uuid.uuid4().hex)
+        self._lock = threading.Lock()
+
+    def _open(self):
+        logger.debug("Starting persistent shell: '%s'", self.shell)
+        self.chan = self.remote._ssh.get_transport().open_session(
+            timeout=self.remote.timeout)
+        self.chan.exec_command(self.shell)
+        if self.init:
+            result = self._run(self.init, subshell=False)
+            if not result.is_ok:
+                self.close()
+                raise CalledProcessError(self.init, result['exit_code'],
+                                         result['stdout'] + result['stderr'])
+
+    def _run(self, command, subshell=True, timeout=None):
+        if subshell:
+            command = u'(\n{0}\n)'.format(command)
+        script = (u'{command} < /dev/null; '
+                  u'printf "%s %d\\n" {marker} $?; '
+                  u'printf "%s\\n" {marker} >&2\n').format(
+                      command=command, marker=self._marker)
+        if isinstance(script, six.text_type):
+            script = script.encode('utf-8')
+        self.chan.sendall(script)
+
+        marker = self._marker.encode('utf-8')
+        out, err = bytearray(), bytearray()
+        out_end = err_end = exit_code = None
+        out_pos = err_pos = 0
+        deadline = None if timeout is None else time.time() + timeout
+        while out_end is None or err_end is None:
+            if out_end is None:
+                index = out.find(marker, out_pos)
+                line_end = out.find(b'\n', index) if index != -1 else -1
+                if line_end != -1:
+                    out_end = index
+                    exit_code = int(out[index + len(marker):line_end])
+                else:
+                    out_pos = max(0, len(out) - len(marker))
+            if err_end is None:
+                index = err.find(marker, err_pos)
+                if index != -1:
+                    err_end = index
+                else:
+                    err_pos = max(0, len(err) - len(marker))
+            if out_end is not None and err_end is not None:
+                break
+            if self.chan.closed or self.chan.eof_received:
+                self.close()
+                raise paramiko.SSHException('Persistent shell is closed')
+            if deadline is not None and time.time() > deadline:
+                self.close()
+                raise CommandTimeoutError(command, timeout)
+            select.select([self.chan], [], [], 1)
+            while self.chan.recv_ready():
+                out.extend(self.chan.recv(CHUNK_SIZE))
+            while self.chan.recv_stderr_ready():
+                err.extend(self.chan.recv_stderr(CHUNK_SIZE))
+        return CommandResult.from_output(bytes(out[:out_end]),
+                                         bytes(err[:err_end]), exit_code)
+
+    def execute(self, command, verbose=True, timeout=None):
+        """Execute command in shell (shell is started if needed)
+
+        :return: CommandResult
+        """
+        if isinstance(command, bytes):
+            command = command.decode('utf-8')
+        start = time.time()
+        with self._lock:
+            if self.chan is None or self.chan.closed:
+                self._open()
+            logger.debug("Executing command in persistent shell: '%s'",
+                         command.rstrip())
+            result = self._run(command, timeout=timeout)
+        metrics.record({'host': self.remote.host, 'operation': 'shell',
+                        'command': command_template(command)},
+                       time.time() - start, errors=int(not result.is_ok),
+                       bytes_out=len(command),
+                       bytes_in=len(result.get_bytes('stdout')) + len(
+                           result.get_bytes('stderr')))
+        if verbose and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("'%s' exit_code is %s", command,
+                         result['exit_code'])
+            if result.get_bytes('stdout'):
+                logger.debug(u'Stdout:\n%s', OutputSummary(
+                    command, result.get_bytes('stdout')))
+            if result.get_bytes('stderr'):
+                logger.debug(u'Stderr:\n%s', OutputSummary(
+                    command, result.get_bytes('stderr')))
+        return result
+
+    def close(self):
+        if self.chan is not None:
+            try:
+                self.chan.close()
+            except Exception:
+                logger.exception("Could not close persistent shell")
+        self.chan = None
+
+    def __del__(self):
+        self.close()
+
+
+@contextmanager
+def _connected(node):
+    """Yield connected SSHClient for node (or SSHClient itself)"""
+    if isinstance(node, SSHClient) and node._ssh is not None:
+        transport = node._ssh.get_transport()
+        connected = transport is not None and transport.is_active()
+    else:
+        connected = False
+    if connected:
+        yield node
+    else:
+        remote = node if isinstance(node, SSHClient) else node.ssh()
+        with remote:
+            yield remote
+
+
+def run_on_nodes(nodes, command, concurrency=10, timeout=None, rolling=None,
+                 check=False):
+    """Connect to nodes and execute command on them in parallel
+
+    Each result has additional `host` and `duration` (connect and execution
+    time in seconds) attributes. If connect or execution fails,
+    `exit_code` of result is None and `error` attribute contains exception.
+
+    :param nodes: list of nodes (objects with `ssh()` method) or SSHClient
+        instances
+    :param command: shell command or callable, which takes connected
+        SSHClient and returns CommandResult
+    :param concurrency: max count of nodes to process simultaneously
+    :param timeout: max command execution time on each node
+    :param rolling: process nodes by groups of `rolling` nodes, next group
+        starts after previous one is finished
+    :param check: raise CalledProcessError, if command failed on some nodes
+        (its `exceptions` attribute contains connect/execution exceptions by
+        hosts, first of them is chained as cause). In rolling mode
+        following groups are not started after failure
+    :return: OrderedDict with hosts as keys and CommandResult as values
+    """
+
+    def run(node):
+        start = time.time()
+        host = None
+        try:
+            with _connected(node) as remote:
+                host = remote.host
+                if callable(command):
+                    result = command(remote)
+                else:
+                    result = remote.execute(command, timeout=timeout)
+            result.error = None
+        except Exception as e:
+            logger.warning('Command failed on {0}: {1}'.format(
+                host or node, e))
+            result = CommandResult.from_output(
+                b'', six.text_type(e).encode('utf-8'), None)
+            result.error = e
+        if host is None:
+            if isinstance(node, SSHClient):
+                host = node.host
+            else:
+                host = getattr(node, 'data', {}).get('ip', str(node))
+        result.host = host
+        result.duration = time.time() - start
+        return result
+
+    nodes = list(nodes)
+    group_size = rolling or len(nodes) or 1
+    results = OrderedDict()
+    workers = ThreadPool(processes=max(1, min(concurrency, group_size)))
+    try:
+        for i in range(0, len(nodes), group_size):
+            group = workers.map(run, nodes[i:i + group_size])
+            results.update((x.host, x) for x in group)
+            errors = {x.host: x['exit_code'] for x in group if not x.is_ok}
+            if check and errors:
+                error = CalledProcessError(command, errors)
+                error.exceptions = {x.host: x.error for x in group
+                                    if x.error is not None}
+                cause = next(iter(error.exceptions.values()), None)
+                six.raise_from(error, cause)
+    finally:
+        workers.close()
+        workers.join()
+    for result in results.values():
+        logger.debug("'{0}' on {1}: exit_code is {2}, took {3:.2f}s".format(
+            command, result.host, result['exit_code'], result.duration))
+    return results
@@ -12,20 +12,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import inspect
+import atexit
+from collections import defaultdict
+from contextlib import contextmanager
+import json
 import logging
 import os
+import random
+import re
 import socket
+import sys
 from tempfile import NamedTemporaryFile
+import threading
 from time import sleep
 from time import time
 import urllib2
 
 import uuid
 from waiting import TimeoutExpired
-from waiting import wait as base_wait
 import yaml
 
+from mos_tests.environment.ssh import command_template
+from mos_tests.functions.stats import Metrics
+from mos_tests import settings
+
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +46,13 @@ def is_stack_exists(stack_name, heat):
         :param heat: Heat API client connection point
         :return True or False
     """
-    return stack_name in [s.stack_name for s in heat.stacks.list()]
+    return find_stack(heat, stack_name) is not None
+
+
+def find_stack(heat, stack_name):
+    """Return stack with stack_name or None"""
+    return resource_index.find(heat.stacks, stack_name, attr='stack_name',
+                               filters={'name': stack_name})
 
 
 def get_stack_id(heat_client, stack_name):
@@ -45,8 +61,9 @@ def get_stack_id(heat_client, stack_name):
         :param stack_name: Name of stack
         :return Stack uid
     """
-    if is_stack_exists(stack_name, heat_client):
-        return heat_client.stacks.list(filter={'name': stack_name}).id
+    stack = find_stack(heat_client, stack_name)
+    if stack is not None:
+        return stack.id
     raise Exception("ERROR: Stack {} is not defined".format(stack_name))
 
 
@@ -112,8 +129,8 @@ def delete_stack(heat_client, uid):
     """
     if uid in [s.id for s in heat_client.stacks.list()]:
         heat_client.stacks.delete(uid)
-        while uid in [s.id for s in heat_client.stacks.list()]:
-            sleep(1)
+        wait(lambda: uid not in [s.id for s in heat_client.stacks.list()],
+             waiting_for='stack {} deletion'.format(uid))
 
 
 def check_stack_status_complete(heat_client, uid, action, timeout=10):
@@ -264,6 +281,280 @@ def download_image(image_link_file, where_to_put='/tmp/'):
         return image_path_on_node
 
 
+# Status polling
+ERROR_STATUSES = ('ERROR', 'ERROR_DELETING')
+
+DELETED_STATUSES = ('DELETED', 'SOFT_DELETED')
+
+
+class StatusError(Exception):
+    """Resource went to error status during waiting"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        super(StatusError, self).__init__(
+            '{0} {1.id} has status {1.status}'.format(
+                resource.__class__.__name__, resource))
+
+
+class ResourceNotFound(Exception):
+    pass
+
+
+def is_not_found(e):
+    """Check that exception is 404 response of any OpenStack client"""
+    code = getattr(e, 'code', None) or getattr(e, 'http_status', None)
+    return code == 404
+
+
+class StatusWaiter(object):
+    """Future-like result of waiting for resource status
+
+    `result` returns resource in expected status (or None if waiting for
+    deletion), raises StatusError on error status, ResourceNotFound if
+    resource disappears, or TimeoutExpired.
+    """
+
+    def __init__(self, poller, manager, uid, status=None,
+                 fail_statuses=ERROR_STATUSES, search_opts=None):
+        self.poller = poller
+        self.manager = manager
+        self.uid = uid
+        self.status = status
+        self.fail_statuses = {x.upper() for x in fail_statuses}
+        # hashable, so waiters can be grouped by filters
+        self.search_opts = tuple(sorted((search_opts or {}).items()))
+        self.last_status = None
+        self.duration = None
+        self._start = time()
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def __str__(self):
+        if self.status is None:
+            return '{0} deletion'.format(self.uid)
+        return '{0} status to be {1}'.format(self.uid, self.status)
+
+    def done(self):
+        return self._event.is_set()
+
+    def _finish(self, result=None, exception=None):
+        self._result = result
+        self._exception = exception
+        self.duration = time() - self._start
+        self._event.set()
+
+    def update(self, resource):
+        """Check resource from last poll, finish waiting if needed"""
+        if resource is None:
+            if self.status is None:
+                self._finish()
+            else:
+                self._finish(exception=ResourceNotFound(
+                    '{0} is not found'.format(self.uid)))
+            return
+        self.last_status = resource.status
+        status = resource.status.upper()
+        if self.status is not None and status == self.status.upper():
+            self._finish(result=resource)
+        elif self.status is None and status in DELETED_STATUSES:
+            self._finish()
+        elif status in self.fail_statuses:
+            self._finish(exception=StatusError(resource))
+
+    def cancel(self):
+        self.poller.discard(self)
+
+    def result(self, timeout=None):
+        """Wait for result
+
+        :param timeout: timeout in seconds (None - wait forever)
+        """
+        __tracebackhide__ = True
+        if not self._event.wait(timeout):
+            self.cancel()
+            raise TimeoutExpired(timeout, self)
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class StatusPoller(object):
+    """Waits for many resources statuses with one request per poll
+
+    Waiters are grouped by client manager (like `nova.servers` or
+    `cinder.volumes`) and list filters. Each tick single waiter is checked
+    with `get`, and many waiters with one `list` call (with `search_opts`
+    filters, if they are given). Polling is made by background thread,
+    which exits when there are no waiters.
+    """
+
+    def __init__(self, sleep_seconds=1):
+        self.sleep_seconds = sleep_seconds
+        self.waiters = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, manager, uid, status=None, fail_statuses=ERROR_STATUSES,
+            search_opts=None):
+        """Register waiter for resource status
+
+        :param manager: client resource manager with `get` and `list`
+        :param uid: resource id
+        :param status: expected status, None to wait for deletion
+        :param fail_statuses: statuses to fail waiting immediately
+        :param search_opts: API-side filters for `list` call, resource
+            must match them (like `{'name': '^prefix'}` for nova servers)
+        :return: StatusWaiter
+        """
+        waiter = StatusWaiter(self, manager, uid, status=status,
+                              fail_statuses=fail_statuses,
+                              search_opts=search_opts)
+        with self._lock:
+            self.waiters.append(waiter)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='status-poller')
+                self._thread.daemon = True
+                self._thread.start()
+        return waiter
+
+    def discard(self, waiter):
+        with self._lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+    def wait_all(self, waiters, timeout=None):
+        """Return results of all waiters (in same order)"""
+        end_time = None if timeout is None else time() + timeout
+        results = []
+        try:
+            for waiter in waiters:
+                if end_time is not None:
+                    timeout = max(end_time - time(), 0)
+                results.append(waiter.result(timeout))
+        finally:
+            for waiter in waiters:
+                self.discard(waiter)
+        return results
+
+    def _fetch(self, manager, uids, search_opts):
+        """Return dict {uid: resource} for uids with one request"""
+        if len(uids) == 1:
+            uid = uids.pop()
+            try:
+                return {uid: manager.get(uid)}
+            except Exception as e:
+                if is_not_found(e):
+                    return {}
+                raise
+        if search_opts:
+            resources = manager.list(search_opts=dict(search_opts))
+        else:
+            resources = manager.list()
+        return {x.id: x for x in resources}
+
+    def _poll(self):
+        groups = {}
+        with self._lock:
+            for waiter in self.waiters:
+                key = (waiter.manager, waiter.search_opts)
+                groups.setdefault(key, []).append(waiter)
+        for (manager, search_opts), waiters in groups.items():
+            try:
+                resources = self._fetch(manager, {x.uid for x in waiters},
+                                        search_opts)
+            except Exception:
+                logger.warning('Error during polling statuses of {0}'.format(
+                    ', '.join(str(x) for x in waiters)), exc_info=True)
+                continue
+            for waiter in waiters:
+                waiter.update(resources.get(waiter.uid))
+                if waiter.done():
+                    self.discard(waiter)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self.waiters:
+                    self._thread = None
+                    return
+            self._poll()
+            sleep(self.sleep_seconds)
+
+
+status_poller = StatusPoller()
+
+
+class ResourceIndex(object):
+    """Short-lived cache of resources lookups by id and by name
+
+    Lookups are made with GET by id (404 means absent) or with API-side
+    filtered list calls, and results are reused for `ttl` seconds, so
+    repeated checks in one wait loop iteration cost one request.
+    """
+
+    def __init__(self, ttl=0.5):
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key, func):
+        now = time()
+        with self._lock:
+            if key in self._cache:
+                value, expires = self._cache[key]
+                if expires > now:
+                    return value
+        value = func()
+        with self._lock:
+            for old_key, (_, expires) in list(self._cache.items()):
+                if expires <= now:
+                    del self._cache[old_key]
+            self._cache[key] = (value, now + self.ttl)
+        return value
+
+    def get(self, manager, uid):
+        """Return resource by id or None if it is absent"""
+        def get():
+            try:
+                resource = manager.get(uid)
+            except Exception as e:
+                if is_not_found(e):
+                    return None
+                raise
+            if getattr(resource, 'status', '').upper() in DELETED_STATUSES:
+                return None
+            return resource
+
+        return self._cached((manager, 'id', uid), get)
+
+    def find(self, manager, name, attr='name', **list_kwargs):
+        """Return first resource with exact name or None
+
+        :param list_kwargs: API-side filters for `manager.list`
+        """
+        def find():
+            for resource in manager.list(**list_kwargs):
+                if getattr(resource, attr) == name:
+                    return resource
+
+        return self._cached((manager, attr, name), find)
+
+    def invalidate(self, manager=None):
+        with self._lock:
+            if manager is None:
+                self._cache.clear()
+                return
+            for key in list(self._cache):
+                if key[0] is manager:
+                    del self._cache[key]
+
+
+resource_index = ResourceIndex()
+
+
 # Instance functions
 def get_inst_id(nova_client, inst_name):
     """Get instance id for instance with the name
@@ -271,10 +562,11 @@ def get_inst_id(nova_client, inst_name):
         :param inst_name: Name of instance
         :return Instance uid
     """
-    inst_list = nova_client.servers.list()
-    if inst_name in [s.name for s in inst_list]:
-        inst_dict = {s.name: s.id for s in inst_list}
-        return inst_dict[inst_name]
+    inst = resource_index.find(
+        nova_client.servers, inst_name,
+        search_opts={'name': '^{}$'.format(re.escape(inst_name))})
+    if inst is not None:
+        return inst.id
     raise Exception("ERROR: Instance {} is not defined".format(inst_name))
 
 
@@ -284,7 +576,7 @@ def is_instance_exists(nova_client, uid):
         :param uid: UID of instance
         :return True or False
     """
-    return uid in [s.id for s in nova_client.servers.list()]
+    return resource_index.get(nova_client.servers, uid) is not None
 
 
 def check_volume(cinder_client, uid):
@@ -293,7 +585,7 @@ def check_volume(cinder_client, uid):
         :param uid: UID of volume
         :return True or False
     """
-    return uid in [s.id for s in cinder_client.volumes.list()]
+    return is_volume_exists(cinder_client, uid)
 
 
 def check_volume_snapshot(cinder_client, uid):
@@ -313,27 +605,27 @@ def check_inst_status(nova_client, uid, status, timeout=5):
         :param timeout: Timeout for check operation
         :return True or False
     """
-    if is_instance_exists(nova_client, uid):
-        start_time = time()
-        inst_status = [s.status for s in nova_client.servers.list()
-                       if s.id == uid][0]
-        while inst_status != status and time() < start_time + 60 * timeout:
-            sleep(1)
-            inst_status = [s.status for s in nova_client.servers.list()
-                           if s.id == uid][0]
-        return inst_status == status
-    return False
+    waiter = status_poller.add(nova_client.servers, uid, status)
+    try:
+        waiter.result(timeout=60 * timeout)
+        return True
+    except (TimeoutExpired, StatusError, ResourceNotFound):
+        return False
 
 
-def delete_instance(nova_client, uid):
+def delete_instance(nova_client, uid, timeout=5):
     """Delete instance and check that it is absent in the list
         :param nova_client: Nova API client connection point
         :param uid: UID of instance
+        :param timeout: Timeout for check operation
     """
     if is_instance_exists(nova_client, uid):
         nova_client.servers.delete(uid)
-        while is_instance_exists(nova_client, uid):
-            sleep(1)
+        resource_index.invalidate(nova_client.servers)
+        # instance in ERROR keeps this status until it is deleted
+        waiter = status_poller.add(nova_client.servers, uid,
+                                   fail_statuses=())
+        waiter.result(timeout=60 * timeout)
 
 
 def create_instance(nova_client, inst_name, flavor_id, net_id,
@@ -352,7 +644,6 @@ def create_instance(nova_client, inst_name, flavor_id, net_id,
         :param inst_list: instances list for cleaning
         :return instance
     """
-    end_time = time() + 60 * timeout
     inst = nova_client.servers.create(
             name=inst_name,
             nics=[{"net-id": net_id}],
@@ -363,16 +654,13 @@ def create_instance(nova_client, inst_name, flavor_id, net_id,
             key_name=key_name)
     if inst_list:
         inst_list.append(inst.id)
-    inst_status = [s.status for s in nova_client.servers.list()
-                   if s.id == inst.id][0]
-    while inst_status != 'ACTIVE':
-        if time() > end_time:
-            raise AssertionError(
-                "Instance status is '{}' instead of 'ACTIVE'".format(
-                    inst_status))
-        sleep(1)
-        inst_status = [s.status for s in nova_client.servers.list()
-                       if s.id == inst.id][0]
+    waiter = status_poller.add(nova_client.servers, inst.id, 'ACTIVE')
+    try:
+        waiter.result(timeout=60 * timeout)
+    except (TimeoutExpired, StatusError):
+        raise AssertionError(
+            "Instance status is '{}' instead of 'ACTIVE'".format(
+                waiter.last_status))
     return inst
 
 
@@ -384,8 +672,8 @@ def delete_floating_ip(nova_client, floating_ip):
     """
     if floating_ip in nova_client.floating_ips.list():
         nova_client.floating_ips.delete(floating_ip)
-        while floating_ip in nova_client.floating_ips.list():
-            sleep(1)
+        wait(lambda: floating_ip not in nova_client.floating_ips.list(),
+             waiting_for='floating ip {} deletion'.format(floating_ip.ip))
 
 
 def check_ip(nova_client, uid, fip, timeout=1):
@@ -415,7 +703,7 @@ def is_volume_exists(cinder_client, uid):
         :param uid: UID of volume
         :return True or False
     """
-    return uid in [s.id for s in cinder_client.volumes.list()]
+    return resource_index.get(cinder_client.volumes, uid) is not None
 
 
 def create_volume(cinder_client, image_id, size=1, timeout=5):
@@ -426,29 +714,31 @@ def create_volume(cinder_client, image_id, size=1, timeout=5):
         :param timeout: Timeout for check operation
         :return volume
     """
-    end_time = time() + 60 * timeout
     volume = cinder_client.volumes.create(size, name='Test_volume',
                                           imageRef=image_id)
-    status = cinder_client.volumes.get(volume.id).status
-    while status != 'available':
-        if time() > end_time:
-            raise AssertionError(
-                "Volume status is '{}' instead of 'available".format(status))
-        sleep(1)
-        status = cinder_client.volumes.get(volume.id).status
+    waiter = status_poller.add(cinder_client.volumes, volume.id, 'available')
+    try:
+        waiter.result(timeout=60 * timeout)
+    except (TimeoutExpired, StatusError):
+        raise AssertionError(
+            "Volume status is '{}' instead of 'available".format(
+                waiter.last_status))
     return volume
 
 
-def delete_volume(cinder_client, volume):
+def delete_volume(cinder_client, volume, timeout=5):
     """Delete volume and check that it is absent in the list
         :param cinder_client: Cinder API client connection point
         :param volume: volume
+        :param timeout: Timeout for check operation
     """
     if volume in cinder_client.volumes.list():
         cinder_client.volumes.delete(volume)
-        volume_id = volume.id
-        while is_volume_exists(cinder_client, volume_id):
-            sleep(1)
+        resource_index.invalidate(cinder_client.volumes)
+        # volume in error status keeps it until it is deleted
+        waiter = status_poller.add(cinder_client.volumes, volume.id,
+                                   fail_statuses=('ERROR_DELETING',))
+        waiter.result(timeout=60 * timeout)
 
 
 def check_volume_status(cinder_client, uid, status, timeout=5):
@@ -459,26 +749,24 @@ def check_volume_status(cinder_client, uid, status, timeout=5):
         :param timeout: Timeout for check operation
         :return True or False
     """
-    if is_volume_exists(cinder_client, uid):
-        start_time = time()
-        inst_status = [s.status for s in cinder_client.volumes.list()
-                       if s.id == uid][0]
-        while inst_status != status and time() < start_time + 60 * timeout:
-            sleep(1)
-            inst_status = [s.status for s in cinder_client.volumes.list()
-                           if s.id == uid][0]
-        return inst_status == status
-    return False
+    waiter = status_poller.add(cinder_client.volumes, uid, status)
+    try:
+        waiter.result(timeout=60 * timeout)
+        return True
+    except (TimeoutExpired, StatusError, ResourceNotFound):
+        return False
 
 
 # Flavor functions
 def is_flavor_exists(nova_client, flavor_id):
     """Check the presence of flavor in the system
         :param nova_client: Nova API client connection point
-        :param flavor_id: name of the flavor
+        :param flavor_id: UID of the flavor
         :return True or False
     """
-    return flavor_id in [f.id for f in nova_client.flavors.list()]
+    # GET by id returns deleted flavors too, so check the list
+    return resource_index.find(nova_client.flavors, flavor_id,
+                               attr='id') is not None
 
 
 def get_flavor_id_by_name(nova_client, flavor_name):
@@ -502,9 +790,11 @@ def delete_flavor(nova_client, flavor_id):
     for flavor in nova_client.flavors.list():
         if flavor.id == flavor_id:
             nova_client.flavors.delete(flavor)
+            resource_index.invalidate(nova_client.flavors)
             break
-    while is_flavor_exists(nova_client, flavor_id):
-        sleep(1)
+    wait(lambda: not is_flavor_exists(nova_client, flavor_id),
+         timeout_seconds=60,
+         waiting_for='flavor {} deletion'.format(flavor_id))
 
 
 # Images
@@ -516,7 +806,7 @@ def is_image_exists(glance_client, image_id):
         :return: True if the image with provided id presents in the system;
         False otherwise
     """
-    return image_id in [image.id for image in glance_client.images.list()]
+    return resource_index.get(glance_client.images, image_id) is not None
 
 
 def delete_image(glance_client, image_id):
@@ -526,8 +816,9 @@ def delete_image(glance_client, image_id):
         :return: Nothing
     """
     glance_client.images.delete(image_id)
-    while is_image_exists(glance_client, image_id):
-        sleep(1)
+    resource_index.invalidate(glance_client.images)
+    wait(lambda: not is_image_exists(glance_client, image_id),
+         waiting_for='image {} deletion'.format(image_id))
 
 
 # execution of system commands
@@ -564,14 +855,13 @@ def check_volume_snapshot_status(cinder_client, uid, status, timeout=5):
             :return True or False
     """
     if check_volume_snapshot(cinder_client, uid):
-        start_time = time()
-        while time() < start_time + 60 * timeout:
-            sleep(1)
-            snapshot_status = [s.status
-                               for s in cinder_client.volume_snapshots.list()
-                               if s.id == uid.id][0]
-            if snapshot_status == status:
-                return True
+        waiter = status_poller.add(cinder_client.volume_snapshots, uid.id,
+                                   status)
+        try:
+            waiter.result(timeout=60 * timeout)
+            return True
+        except (TimeoutExpired, StatusError, ResourceNotFound):
+            pass
     return False
 
 
@@ -582,8 +872,8 @@ def delete_volume_snapshot(cinder_client, snapshot):
     """
     if snapshot in cinder_client.volume_snapshots.list():
         cinder_client.volume_snapshots.delete(snapshot)
-        while snapshot in cinder_client.volume_snapshots.list():
-            sleep(1)
+        wait(lambda: snapshot not in cinder_client.volume_snapshots.list(),
+             waiting_for='volume snapshot {} deletion'.format(snapshot.id))
 
 
 # Keys
@@ -606,29 +896,208 @@ def delete_keys(nova_client, key_name):
         if key.name == key_name:
             nova_client.keypairs.delete(key)
             break
-    while is_key_exists(nova_client, key_name):
-        sleep(1)
+    wait(lambda: not is_key_exists(nova_client, key_name),
+         waiting_for='keypair {} deletion'.format(key_name))
+
+
+class WaitStats(object):
+    """Observed durations of waits grouped by `waiting_for` template
+
+    Durations are stored to json file (`settings.WAIT_STATS_FILE`) at exit
+    and merged with existing ones, so next runs can predict completion.
+    Nothing is collected if path is not set.
+    """
+
+    max_samples = 20
 
+    def __init__(self, path):
+        self.path = path
+        self.samples = None
+        self.new_samples = defaultdict(list)
+        self._lock = threading.Lock()
 
-def wait(*args, **kwargs):
+    @staticmethod
+    def key(waiting_for):
+        return command_template(waiting_for)
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            logger.warning('Wait stats file {} is broken'.format(self.path))
+            return {}
+
+    def add(self, waiting_for, duration):
+        if not self.path:
+            return
+        with self._lock:
+            self.new_samples[self.key(waiting_for)].append(duration)
+
+    def expected(self, waiting_for):
+        """Return median of observed durations or None"""
+        key = self.key(waiting_for)
+        with self._lock:
+            if self.samples is None:
+                self.samples = self._read()
+            samples = self.samples.get(key, [])
+            samples = samples + self.new_samples.get(key, [])
+        if not samples:
+            return None
+        return sorted(samples)[len(samples) // 2]
+
+    def save(self):
+        with self._lock:
+            if not self.path or not self.new_samples:
+                return
+            data = self._read()
+            for key, samples in self.new_samples.items():
+                samples = data.get(key, []) + samples
+                data[key] = samples[-self.max_samples:]
+            self.new_samples.clear()
+        tmp_path = '{}.{}'.format(self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+wait_stats = WaitStats(settings.WAIT_STATS_FILE)
+if wait_stats.path:
+    atexit.register(wait_stats.save)
+
+# Time spent in waits by call site and `waiting_for` template
+wait_metrics = Metrics()
+
+_deadlines = threading.local()
+
+
+def get_deadline():
+    """Return nearest inherited deadline (timestamp) or None"""
+    stack = getattr(_deadlines, 'stack', [])
+    return min(stack) if stack else None
+
+
+@contextmanager
+def deadline(timeout_seconds):
+    """Limit all waits inside context with timeout
+
+    Nested deadlines can only shorten outer ones.
+    """
+    if not hasattr(_deadlines, 'stack'):
+        _deadlines.stack = []
+    _deadlines.stack.append(time() + timeout_seconds)
+    try:
+        yield
+    finally:
+        _deadlines.stack.pop()
+
+
+def _sleep_bounds(sleep_seconds):
+    """Return (min, max, multiplier) of sleep intervals
+
+    Like in `waiting` package, single value is constant interval, and
+    tuple means backoff from min to max (missing max is limited with
+    WAIT_MAX_SLEEP).
+    """
+    if isinstance(sleep_seconds, (tuple, list)):
+        min_sleep, max_sleep = sleep_seconds[:2]
+        if max_sleep is None:
+            max_sleep = max(min_sleep, settings.WAIT_MAX_SLEEP)
+        multiplier = sleep_seconds[2] if len(sleep_seconds) > 2 else 2
+        return min_sleep, max_sleep, multiplier
+    return sleep_seconds, sleep_seconds, 1
+
+
+def wait(predicate, timeout_seconds=None, sleep_seconds=1, waiting_for=None,
+         on_poll=None, expected_exceptions=()):
+    """Wait until predicate returns true value and return this value
+
+    Polls are made with `sleep_seconds` intervals (with jitter). For waits
+    with `waiting_for` durations can be collected (see `WaitStats`), and
+    then first sleep is prolonged to expected completion time. Timeout
+    is limited by inherited `deadline` and nested waits inherit this wait
+    timeout.
+
+    :param predicate: callable to check
+    :param timeout_seconds: timeout (None - wait forever)
+    :param sleep_seconds: interval between polls or tuple
+        (min, max, multiplier) for growing intervals
+    :param waiting_for: event description for logs and statistics
+    :param on_poll: callable to call after each poll
+    :param expected_exceptions: exceptions to ignore during polling
+    """
     __tracebackhide__ = True
 
-    frame = inspect.stack()[1]
-    called_from = '{0.f_globals[__name__]}:{2}'.format(*frame)
-    event = kwargs.get('waiting_for', args[0].__name__)
+    frame = sys._getframe(1)
+    called_from = '{0}:{1}'.format(frame.f_globals.get('__name__'),
+                                   frame.f_lineno)
+    del frame
+    event = waiting_for or predicate.__name__
     msg = '{called_from}: waiting for {event}'.format(event=event,
                                                       called_from=called_from)
     logger = logging.getLogger('waiting')
 
     logger.info(msg)
 
+    start = time()
+    end_time = None
+    if timeout_seconds is not None:
+        end_time = start + timeout_seconds
+    inherited = get_deadline()
+    if inherited is not None and (end_time is None or inherited < end_time):
+        end_time = inherited
+        timeout_seconds = max(inherited - start, 0)
+    min_sleep, max_sleep, multiplier = _sleep_bounds(sleep_seconds)
+    interval = min_sleep
+    expected = None
+    if waiting_for:
+        expected = wait_stats.expected(waiting_for)
+    polls = 0
+    swallowed = defaultdict(int)
+    outcome = 'error'
     try:
-        result = base_wait(*args, **kwargs)
-        logger.info(msg + ' ... done')
-        return result
-    except TimeoutExpired as e:
-        # prevent shows traceback from waiting package
-        raise e
+        while True:
+            try:
+                if end_time is None:
+                    result = predicate()
+                else:
+                    with deadline(end_time - time()):
+                        result = predicate()
+                if on_poll is not None:
+                    on_poll()
+            except expected_exceptions as e:
+                swallowed[type(e).__name__] += 1
+                result = None
+            polls += 1
+            now = time()
+            if result:
+                outcome = 'done'
+                if waiting_for:
+                    wait_stats.add(waiting_for, now - start)
+                logger.info(msg + ' ... done')
+                return result
+            if end_time is not None and now >= end_time:
+                outcome = 'timeout'
+                raise TimeoutExpired(timeout_seconds, event)
+            if polls == 1 and expected is not None:
+                # second poll near to expected completion time
+                delay = max(expected * 0.9 - (now - start), min_sleep)
+            else:
+                delay = interval * random.uniform(1 - settings.WAIT_JITTER,
+                                                  1 + settings.WAIT_JITTER)
+                interval = min(interval * multiplier, max_sleep)
+            if end_time is not None:
+                delay = min(delay, end_time - now)
+            sleep(delay)
+    finally:
+        counters = {'swallowed_' + k: v for k, v in swallowed.items()}
+        wait_metrics.record(
+            {'site': called_from, 'waiting_for': WaitStats.key(event)},
+            time() - start, polls=polls, swallowed=sum(swallowed.values()),
+            timeouts=int(outcome == 'timeout'),
+            errors=int(outcome == 'error'), **counters)
 
 
 def gen_random_resource_name(prefix=None, reduce_by=None):
@@ -638,12 +1107,32 @@ def gen_random_resource_name(prefix=None, reduce_by=None):
     return random_name
 
 
+TEMP_DIR = os.path.join(os.path.dirname(__file__), '../../temp')
+
+
 def gen_temp_file(prefix='tmp', suffix=''):
-    tempdir = os.path.join(os.path.dirname(__file__), '../../temp')
-    return NamedTemporaryFile(prefix=prefix, suffix=suffix, dir=tempdir,
+    return NamedTemporaryFile(prefix=prefix, suffix=suffix, dir=TEMP_DIR,
                               delete=False)
 
 
+class cached_property(object):
+    """Property, which value is computed once on first access
+
+    Value is stored in instance __dict__, so it can be reset with `del`.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+        self.__name__ = func.__name__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.__name__] = self.func(obj)
+        return value
+
+
 def get_os_conn(environment):
     return environment.os_conn
 
@@ -0,0 +1,191 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Run python CLI clients inside test process.
+
+`InProcessCLIClient` is a drop-in replacement of tempest `base.CLIClient`,
+which calls client shell entry point (like `glanceclient.shell:main`)
+instead of spawning new interpreter for each command. Output is captured
+as bytes encoded to UTF-8 (like with `PYTHONIOENCODING=UTF-8`), so results
+are the same as tempest `execute` returns.
+"""
+
+from contextlib import contextmanager
+import importlib
+import io
+import logging
+import os
+import shlex
+import sys
+import threading
+
+import six
+from tempest.lib.cli import base
+from tempest.lib import exceptions
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINTS = {
+    'glance': 'glanceclient.shell:main',
+}
+
+# sys.std* and sys.argv are global, so only one command can run at a time
+_lock = threading.Lock()
+
+
+class _Output(object):
+    """File-like object, which stores written text as UTF-8 bytes"""
+
+    encoding = 'utf-8'
+    errors = 'strict'
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def write(self, data):
+        if isinstance(data, six.text_type):
+            data = data.encode(self.encoding)
+        self.buffer.write(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+    def fileno(self):
+        raise io.UnsupportedOperation('fileno')
+
+
+class _Input(object):
+    """Empty terminal-like stdin, so clients don't wait for image data"""
+
+    encoding = 'utf-8'
+    buffer = io.BytesIO()
+
+    def read(self, size=-1):
+        return b''
+
+    readline = read
+
+    def isatty(self):
+        return True
+
+
+def _load_entry_point(cmd):
+    try:
+        path = ENTRY_POINTS[cmd]
+    except KeyError:
+        raise ValueError('In-process run of `{}` is not supported'.format(
+            cmd))
+    module_name, func_name = path.split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def _parse_prefix(prefix):
+    """Return environment variables from `env NAME=value` prefix"""
+    args = shlex.split(prefix)
+    if not args:
+        return {}
+    if args[0] != 'env' or not all('=' in x for x in args[1:]):
+        raise ValueError('Unsupported command prefix: {}'.format(prefix))
+    return dict(x.split('=', 1) for x in args[1:])
+
+
+@contextmanager
+def _environ(variables):
+    saved = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def run(cmd, args, merge_stderr=False, environ=None):
+    """Run client shell with args in current process
+
+    :param cmd: client name (key of ENTRY_POINTS)
+    :param args: list of command line arguments (without program name)
+    :param merge_stderr: write stderr to stdout, like `2>&1`
+    :param environ: dict with extra environment variables
+    :return: tuple (exit code, stdout bytes, stderr bytes)
+    """
+    main = _load_entry_point(cmd)
+    stdout = io.BytesIO()
+    stderr = stdout if merge_stderr else io.BytesIO()
+    with _lock, _environ(environ or {}):
+        saved = sys.argv, sys.stdin, sys.stdout, sys.stderr
+        sys.argv = [cmd] + list(args)
+        sys.stdin = _Input()
+        sys.stdout = _Output(stdout)
+        sys.stderr = _Output(stderr)
+        try:
+            code = main() or 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                sys.stderr.write('{}\n'.format(e.code))
+                code = 1
+        finally:
+            sys.argv, sys.stdin, sys.stdout, sys.stderr = saved
+    return code, stdout.getvalue(), stderr.getvalue()
+
+
+def execute(cmd, action, flags='', params='', fail_ok=False,
+            merge_stderr=False, prefix=''):
+    """In-process analogue of `tempest.lib.cli.base.execute`"""
+    command = ' '.join([cmd, flags, action, params]).strip()
+    logger.info("running in-process: '{}'".format(command))
+    if six.PY2:
+        command = command.encode('utf-8')
+    args = shlex.split(command)[1:]
+    code, result, result_err = run(cmd, args, merge_stderr=merge_stderr,
+                                   environ=_parse_prefix(prefix))
+    if code != 0 and not fail_ok:
+        raise exceptions.CommandFailed(code, command, result, result_err)
+    if six.PY2:
+        return result
+    return result.decode('utf-8')
+
+
+class InProcessCLIClient(base.CLIClient):
+    """tempest CLIClient, which runs commands in current process"""
+
+    def cmd_with_auth(self, cmd, action, flags='', params='',
+                      fail_ok=False, merge_stderr=False):
+        creds = ('--os-username {0.username} '
+                 '--os-tenant-name {0.tenant_name} '
+                 '--os-password {0.password} '
+                 '--os-auth-url {0.uri}').format(self)
+        if getattr(self, 'identity_api_version', None):
+            creds += ' --os-identity-api-version {}'.format(
+                self.identity_api_version)
+        if self.insecure:
+            flags = creds + ' --insecure ' + flags
+        else:
+            flags = creds + ' ' + flags
+        return execute(cmd, action, flags, params, fail_ok, merge_stderr,
+                       prefix=self.prefix)
@@ -13,45 +13,138 @@
 #    under the License.
 
 import json
+import logging
 
-from tempest.lib.cli import output_parser as parser
+from six.moves import shlex_quote
 from tempest.lib import exceptions
 
+from mos_tests.environment.ssh import PersistentShell
+from mos_tests.environment.ssh import read_channel
+from mos_tests.functions import output_parser
+
+logger = logging.getLogger(__name__)
+
 
 class Result(str):
     def listing(self):
-        return parser.listing(self)
+        return output_parser.listing(self)
+
+    def iter_listing(self):
+        return output_parser.iter_listing(self)
 
     def details(self):
-        return parser.details(self)
+        return output_parser.details(self)
 
     def __add__(self, other):
         return self.__class__(super(Result, self).__add__(other))
 
 
-def os_execute(remote, command, fail_ok=False, merge_stderr=False):
-    command = command.encode('utf-8')
-    command = '. openrc && {}'.format(command)
-    result = remote.execute(command)
-    if not fail_ok and not result.is_ok:
-        raise exceptions.CommandFailed(result['exit_code'],
-                                       command,
-                                       result.stdout_string,
-                                       result.stderr_string)
+def make_result(command, exit_code, stdout, stderr, fail_ok=False,
+                merge_stderr=False):
+    if not fail_ok and exit_code != 0:
+        raise exceptions.CommandFailed(exit_code, command, stdout, stderr)
     output = Result()
     if merge_stderr:
-        output += result.stderr_string
-    return output + result.stdout_string
+        output += stderr
+    return output + stdout
+
+
+# Executes commands from json list on stdin one by one, writes
+# `<length>\n<json result>` for each of them to stdout
+BATCH_SCRIPT = """
+import json, subprocess, sys
+for command in json.load(sys.stdin):
+    proc = subprocess.Popen(command, shell=True, stdin=open('/dev/null'),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = proc.communicate()
+    data = json.dumps({'exit_code': proc.returncode,
+                       'stdout': out.decode('utf-8', 'replace'),
+                       'stderr': err.decode('utf-8', 'replace')})
+    sys.stdout.write('%d\\n%s' % (len(data), data))
+    sys.stdout.flush()
+"""
+
+
+def os_execute_batch(remote, commands):
+    """Execute commands with openrc sourced by single remote script
+
+    :param commands: list of commands
+    :return: list of dicts with `exit_code`, `stdout` and `stderr` keys
+    """
+    script = '. openrc && python -c {}'.format(shlex_quote(BATCH_SCRIPT))
+    logger.debug('Execute batch of commands: {}'.format(commands))
+    chan, stdin, _, _ = remote.execute_async(script)
+    stdin.write(json.dumps(commands))
+    stdin.flush()
+    chan.shutdown_write()
+    out, err, exit_code = read_channel(chan)
+    chan.close()
+    if exit_code != 0:
+        raise exceptions.CommandFailed(exit_code, script, out, err)
+    results = []
+    position = 0
+    while position < len(out):
+        line_end = out.index(b'\n', position)
+        size = int(out[position:line_end])
+        position = line_end + 1 + size
+        results.append(json.loads(out[line_end + 1:position].decode('ascii')))
+    return results
+
+
+def os_execute(remote, command, fail_ok=False, merge_stderr=False,
+               shell=None):
+    """Execute command with openrc sourced
+
+    :param shell: PersistentShell with sourced openrc to execute command in,
+        else command is executed on remote with new channel
+    """
+    command = command.encode('utf-8')
+    if shell is None:
+        command = '. openrc && {}'.format(command)
+        result = remote.execute(command)
+    else:
+        result = shell.execute(command)
+    return make_result(command, result['exit_code'], result.stdout_string,
+                       result.stderr_string, fail_ok=fail_ok,
+                       merge_stderr=merge_stderr)
 
 
 class CLICLient(object):
+    """Remote CLI client
+
+    :param remote: connected SSHClient
+    :param persistent: execute commands in single long-lived shell with
+        openrc sourced once (shell should be closed with `close`)
+    """
 
     command = ''
 
-    def __init__(self, remote):
+    # Option for machine readable output, if client supports it
+    structured_output = None
+
+    def __init__(self, remote, persistent=False):
         self.remote = remote
+        self.shell = None
+        if persistent:
+            self.shell = PersistentShell(remote, init='. openrc')
         super(CLICLient, self).__init__()
 
+    def close(self):
+        if self.shell is not None:
+            self.shell.close()
+
+    def batch(self):
+        """Return CLIBatch to execute several commands with single script
+
+        Usage:
+
+            with client.batch() as batch:
+                batch('project create', params='p1 -f json')
+                batch('project create', params='p2 -f json')
+            p1, p2 = batch.results
+        """
+        return CLIBatch(self)
+
     def build_command(self, action, flags='', params='', prefix=''):
         return u' '.join([prefix, self.command, flags, action, params])
 
@@ -59,49 +152,97 @@ class CLICLient(object):
                 merge_stderr=False):
         command = self.build_command(action, flags, params, prefix)
         return os_execute(self.remote, command, fail_ok=fail_ok,
-                          merge_stderr=merge_stderr)
+                          merge_stderr=merge_stderr, shell=self.shell)
+
+    def _structured(self, action, flags, params, prefix):
+        if self.structured_output is not None:
+            params = u' '.join([params, self.structured_output])
+        return self(action, flags=flags, params=params, prefix=prefix)
+
+    def get_listing(self, action, flags='', params='', prefix=''):
+        """Execute listing command and return list of dicts"""
+        return self._structured(action, flags, params, prefix).listing()
+
+    def get_details(self, action, flags='', params='', prefix=''):
+        """Execute show command and return dict with item details"""
+        return self._structured(action, flags, params, prefix).details()
+
+
+class CLIBatch(object):
+    """Commands of CLI client, which are executed with single remote script
+
+    Commands are collected by calls (with CLICLient call arguments) and
+    executed on `execute` call (or on exit from `with` block). Commands
+    are executed in order, all of them are executed even if some fail.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+        self.results = None
+
+    def __call__(self, action, flags='', params='', prefix='', fail_ok=False,
+                 merge_stderr=False):
+        command = self.client.build_command(action, flags, params, prefix)
+        self.commands.append((command, fail_ok, merge_stderr))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def execute(self):
+        """Execute collected commands
+
+        :return: list of Result
+        """
+        outputs = os_execute_batch(self.client.remote,
+                                   [x[0] for x in self.commands])
+        self.results = [
+            make_result(command, output['exit_code'],
+                        output['stdout'].strip(), output['stderr'].strip(),
+                        fail_ok=fail_ok, merge_stderr=merge_stderr)
+            for (command, fail_ok, merge_stderr), output in zip(
+                self.commands, outputs)]
+        return self.results
 
 
 class OpenStack(CLICLient):
     command = 'openstack'
+    structured_output = '-f json'
 
     def details(self, output):
-        data = json.loads(output)
-        if isinstance(data, list):
-            data = {x['Field']: x['Value'] for x in data}
-        return data
+        return output_parser.details(output)
 
     def project_create(self, name):
-        output = self('project create', params='{} -f json'.format(name))
-        return self.details(output)
+        return self.get_details('project create', params=name)
 
     def project_delete(self, name):
         return self('project delete', params=name)
 
     def user_create(self, name, password, project=None):
-        params = '{name} --password {password} -f json'.format(
+        params = '{name} --password {password}'.format(
             name=name, password=password)
         if project is not None:
             params += ' --project {}'.format(project)
-        output = self('user create', params=params)
-        return self.details(output)
+        return self.get_details('user create', params=params)
 
     def user_delete(self, name):
         return self('user delete', params=name)
 
     def role_create(self, name):
-        output = self('role create', params='{} -f json'.format(name))
-        return self.details(output)
+        return self.get_details('role create', params=name)
 
     def role_delete(self, name):
         return self('role delete', params=name)
 
     def assign_role_to_user(self, role_name, user, project):
-        output = self(
+        return self.get_details(
             'role add',
-            params='{name} --user {user} --project {project} -f json'.format(
+            params='{name} --user {user} --project {project}'.format(
                 name=role_name, user=user, project=project))
-        return self.details(output)
 
 
 class Glance(CLICLient):
@@ -0,0 +1,135 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Single-pass parser of CLI clients ASCII tables.
+
+Results are compatible with `tempest.lib.cli.output_parser`:
+
+    +----+------+
+    | ID | Name |      listing() -> [{'ID': '1', 'Name': 'foo'}]
+    +----+------+
+    | 1  | foo  |
+    +----+------+
+"""
+
+import json
+import logging
+
+from tempest.lib import exceptions
+
+logger = logging.getLogger(__name__)
+
+
+def _is_delimiter(line):
+    """Check that line is like +----+------+"""
+    if len(line) < 3 or line[0] != '+' or line[-1] != '+':
+        return False
+    return not line.strip('+-')
+
+
+def _columns(delimiter):
+    """Return list of (start, end) positions of columns"""
+    positions = []
+    start = 1
+    while True:
+        end = delimiter.find('+', start)
+        if end == -1:
+            return positions
+        positions.append((start, end))
+        start = end + 1
+
+
+def iter_tables(output):
+    """Yield (label, headers, rows iterator) for each table in output
+
+    Rows iterator must be consumed before next table is requested.
+    """
+    lines = iter(output.splitlines())
+    label = None
+    for line in lines:
+        line = line.rstrip()
+        if not _is_delimiter(line):
+            if label is None:
+                label = line
+            elif line:
+                logger.warning('Invalid line between tables: %s', line)
+            continue
+        columns = _columns(line)
+        headers = None
+        for line in lines:
+            line = line.rstrip()
+            if _is_delimiter(line):
+                break
+            if headers is None and '|' in line:
+                headers = [line[a:b].strip() for a, b in columns]
+        if headers is None:
+            continue
+
+        def rows(columns=columns):
+            for line in lines:
+                line = line.rstrip()
+                if _is_delimiter(line):
+                    return
+                if '|' not in line:
+                    logger.warning('skipping invalid table line: %s', line)
+                    continue
+                yield [line[a:b].strip() for a, b in columns]
+
+        yield label, headers, rows()
+        label = None
+
+
+def iter_listing(output):
+    """Yield dicts with row values (by headers) of first table lazily"""
+    for _, headers, rows in iter_tables(output):
+        for row in rows:
+            yield dict(zip(headers, row))
+        return
+
+
+def listing(output):
+    """Return list of dicts with item info parsed from output
+
+    JSON output (`-f json`) is parsed as is.
+    """
+    if output.lstrip().startswith('['):
+        return json.loads(output)
+    return list(iter_listing(output))
+
+
+def details_multiple(output, with_label=False):
+    """Return list of dicts with item details from Property/Value tables"""
+    items = []
+    for label, headers, rows in iter_tables(output):
+        if 'Property' not in headers or 'Value' not in headers:
+            raise exceptions.InvalidStructure()
+        item = {row[0]: row[1] for row in rows}
+        if with_label:
+            item['__label'] = label
+        items.append(item)
+    return items
+
+
+def details(output, with_label=False):
+    """Return dict with item details parsed from output
+
+    JSON output (`-f json`) is parsed as is.
+    """
+    if output.lstrip().startswith(('{', '[')):
+        data = json.loads(output)
+        if isinstance(data, list):
+            # old cliff versions format single item as list of fields
+            data = {x['Field']: x['Value'] for x in data}
+        return data
+    return details_multiple(output, with_label=with_label)[0]
@@ -0,0 +1,207 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import defaultdict
+import csv
+import json
+import math
+import os
+import threading
+
+
+class Histogram(object):
+    """Histogram of durations (in seconds) with power of 2 ms buckets
+
+    Bucket `n` counts values in range (2 ** (n - 1), 2 ** n] milliseconds,
+    bucket 0 counts values up to 1 ms.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = defaultdict(int)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if value <= 0.001:
+            bucket = 0
+        else:
+            bucket = int(math.ceil(math.log(value * 1000, 2)))
+        self.buckets[bucket] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, percent):
+        """Return estimated percentile (upper bound of bucket)"""
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** bucket / 1000.0, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': {'<={}ms'.format(2 ** k): v
+                        for k, v in sorted(self.buckets.items())},
+        }
+
+
+class Metrics(object):
+    """Thread-safe duration histograms and counters grouped by tags
+
+    Usage:
+
+        metrics = Metrics()
+        metrics.record({'host': '10.0.0.1', 'command': 'uptime'}, 0.03,
+                       bytes_in=120)
+        metrics.dump_json('stats.json')
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, tags, duration, **counters):
+        """Add duration and increase counters for entry with tags
+
+        :param tags: dict with entry tags
+        :param duration: duration in seconds
+        """
+        key = tuple(sorted(tags.items()))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = (Histogram(), defaultdict(int))
+            histogram, entry_counters = entry
+            histogram.add(duration)
+            for name, value in counters.items():
+                entry_counters[name] += value
+
+    def records(self):
+        """Return list of entries as dicts sorted by total duration"""
+        with self._lock:
+            records = []
+            for key, (histogram, counters) in self._entries.items():
+                record = dict(key)
+                record.update(counters)
+                record['duration'] = histogram.to_dict()
+                records.append(record)
+        records.sort(key=lambda x: x['duration']['total'], reverse=True)
+        return records
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.records(), f, indent=2, sort_keys=True)
+
+    def dump_csv(self, path):
+        """Write entries to csv file (without histogram buckets)"""
+        rows = []
+        for record in self.records():
+            duration = record.pop('duration')
+            duration.pop('buckets')
+            record.update(('duration_' + k, v) for k, v in duration.items())
+            rows.append(record)
+        fields = sorted(set(k for x in rows for k in x))
+        with open(path, 'w') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+class MetricsReport(object):
+    """Pytest plugin helper to write `Metrics` at session end
+
+    Registers command line option with path to statistics file, dumps
+    metrics to it (json, or csv for `.csv` extension) and shows top
+    entries in terminal summary. File is written only if option is given,
+    relative path is resolved near junit xml report.
+
+    :param metrics: `Metrics` instance
+    :param option: command line option name
+    :param what: statistics description for option help
+    :param title: terminal summary title
+    :param columns: format string of entry tags and counters, which are
+        shown after duration in terminal summary
+    :param top: count of entries in terminal summary
+    """
+
+    line_format = '{total:8.2f}s {count:6d}x p95 {p95:.3f}s  '
+
+    def __init__(self, metrics, option, what, title, columns, top=10):
+        self.metrics = metrics
+        self.option = option
+        self.what = what
+        self.title = title
+        self.columns = columns
+        self.top = top
+
+    def addoption(self, parser):
+        parser.addoption(
+            self.option, action="store", metavar="PATH",
+            help="Write {} to file (.json or .csv), relative path is near "
+                 "junit xml report".format(self.what))
+
+    def get_path(self, config):
+        """Return path of statistics file or None if it is not requested"""
+        path = config.getoption(self.option)
+        if not path:
+            return None
+        xmlpath = getattr(config.option, 'xmlpath', None)
+        directory = os.path.dirname(os.path.abspath(xmlpath or 'report.xml'))
+        return os.path.join(directory, os.path.expanduser(path))
+
+    def dump(self, config):
+        path = self.get_path(config)
+        if path is None or len(self.metrics) == 0:
+            return
+        if path.endswith('.csv'):
+            self.metrics.dump_csv(path)
+        else:
+            self.metrics.dump_json(path)
+
+    def summary(self, terminalreporter):
+        records = self.metrics.records()
+        if not records:
+            return
+        terminalreporter.write_sep('-', self.title)
+        for record in records[:self.top]:
+            line = self.line_format.format(**record['duration'])
+            terminalreporter.write_line(line + self.columns.format(**record))
+        path = self.get_path(terminalreporter.config)
+        if path is not None:
+            terminalreporter.write_line('Full statistics: {}'.format(path))
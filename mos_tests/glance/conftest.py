@@ -19,7 +19,10 @@ import pytest
 from six.moves import configparser
 from tempest.lib.cli import base
 
+from mos_tests import settings
+from mos_tests.environment.ssh import run_on_nodes
 from mos_tests.functions import common
+from mos_tests.functions import local_cli
 from mos_tests.functions import os_cli
 
 
@@ -27,25 +30,22 @@ from mos_tests.functions import os_cli
 def short_lifetime_keystone(env):
     """Change keystone token lifetime to 30s"""
 
-    def set_lifetime(node):
-        with node.ssh() as remote:
-            remote.check_call('service apache2 stop')
-            remote.check_call('mv /etc/keystone/keystone.conf '
-                              '/etc/keystone/keystone.conf.orig')
-            with remote.open('/etc/keystone/keystone.conf.orig') as f:
-                parser = configparser.RawConfigParser()
-                parser.readfp(f)
-                parser.set('token', 'expiration', 30)
-                with remote.open('/etc/keystone/keystone.conf', 'w') as new_f:
-                    parser.write(new_f)
-            remote.check_call('service apache2 start')
-
-    def reset_lifetime(node):
-        with node.ssh() as remote:
-            remote.check_call('service apache2 stop')
-            remote.check_call('mv /etc/keystone/keystone.conf.orig '
-                              '/etc/keystone/keystone.conf')
-            remote.check_call('service apache2 start')
+    def set_lifetime(remote):
+        remote.check_call('service apache2 stop')
+        remote.check_call('mv /etc/keystone/keystone.conf '
+                          '/etc/keystone/keystone.conf.orig')
+        with remote.open('/etc/keystone/keystone.conf.orig') as f:
+            parser = configparser.RawConfigParser()
+            parser.readfp(f)
+            parser.set('token', 'expiration', 30)
+            with remote.open('/etc/keystone/keystone.conf', 'w') as new_f:
+                parser.write(new_f)
+        return remote.check_call('service apache2 start')
+
+    reset_lifetime = ('service apache2 stop && '
+                      'mv /etc/keystone/keystone.conf.orig '
+                      '/etc/keystone/keystone.conf && '
+                      'service apache2 start')
 
     def wait_keystone_alive():
         common.wait(lambda: common.get_os_conn(env), timeout_seconds=60 * 3,
@@ -53,24 +53,26 @@ def short_lifetime_keystone(env):
                     expected_exceptions=Exception)
 
     controllers = env.get_nodes_by_role('controller')
-    for controller in controllers:
-        set_lifetime(controller)
+    run_on_nodes(controllers, set_lifetime, check=True)
     wait_keystone_alive()
     yield
-    for controller in controllers:
-        reset_lifetime(controller)
+    run_on_nodes(controllers, reset_lifetime, check=True)
     wait_keystone_alive()
 
 
 @pytest.fixture
 def cli(os_conn):
-    return base.CLIClient(username=os_conn.username,
-                          password=os_conn.password,
-                          tenant_name=os_conn.tenant,
-                          uri=os_conn.session.auth.auth_url,
-                          cli_dir='.tox/glance/bin',
-                          insecure=os_conn.insecure,
-                          prefix='env PYTHONIOENCODING=UTF-8')
+    if settings.GLANCE_CLI_IN_PROCESS:
+        client_class = local_cli.InProcessCLIClient
+    else:
+        client_class = base.CLIClient
+    return client_class(username=os_conn.username,
+                        password=os_conn.password,
+                        tenant_name=os_conn.tenant,
+                        uri=os_conn.session.auth.auth_url,
+                        cli_dir='.tox/glance/bin',
+                        insecure=os_conn.insecure,
+                        prefix='env PYTHONIOENCODING=UTF-8')
 
 
 @pytest.fixture
@@ -102,16 +104,19 @@ def image_file_remote(request, controller_remote, suffix):
     controller_remote.execute('rm -f {}'.format(filename))
 
 
-@pytest.fixture
+@pytest.yield_fixture
 def openstack_client(controller_remote):
-    return os_cli.OpenStack(controller_remote)
+    client = os_cli.OpenStack(controller_remote, persistent=True)
+    yield client
+    client.close()
 
 
-@pytest.fixture(params=['1', '2'], ids=['api v1', 'api v2'])
+@pytest.yield_fixture(params=['1', '2'], ids=['api v1', 'api v2'])
 def glance_remote(request, controller_remote):
     flags = '--os-image-api-version {0.param}'.format(request)
-    return partial(os_cli.Glance(controller_remote), flags=flags,
-                   prefix='env PYTHONIOENCODING=UTF-8')
+    client = os_cli.Glance(controller_remote, persistent=True)
+    yield partial(client, flags=flags, prefix='env PYTHONIOENCODING=UTF-8')
+    client.close()
 
 
 @pytest.yield_fixture
@@ -136,21 +141,17 @@ def user(openstack_client, suffix, project):
 def enable_multiple_locations_glance(env):
     """Change show_multiple_locations to true"""
 
-    def set_show_multiple_locations(node):
-        with node.ssh() as remote:
-            remote.check_call('mv /etc/glance/glance-api.conf '
-                              '/etc/glance/glance-api.conf.orig')
-            remote.check_call("cat /etc/glance/glance-api.conf.orig | sed "
-                              "'s/#show_multiple_locations = false/"
-                              "show_multiple_locations = true/g' > "
-                              "/etc/glance/glance-api.conf")
-            remote.check_call('service glance-api restart')
-
-    def reset_show_multiple_locations(node):
-        with node.ssh() as remote:
-            remote.check_call('mv /etc/glance/glance-api.conf.orig '
-                              '/etc/glance/glance-api.conf')
-            remote.check_call('service glance-api restart')
+    set_show_multiple_locations = (
+        "mv /etc/glance/glance-api.conf /etc/glance/glance-api.conf.orig && "
+        "cat /etc/glance/glance-api.conf.orig | sed "
+        "'s/#show_multiple_locations = false/"
+        "show_multiple_locations = true/g' > "
+        "/etc/glance/glance-api.conf && "
+        "service glance-api restart")
+
+    reset_show_multiple_locations = (
+        'mv /etc/glance/glance-api.conf.orig /etc/glance/glance-api.conf && '
+        'service glance-api restart')
 
     def wait_glance_alive():
         common.wait(lambda: common.get_os_conn(env), timeout_seconds=60 * 3,
@@ -158,12 +159,10 @@ def enable_multiple_locations_glance(env):
                     expected_exceptions=Exception)
 
     controllers = env.get_nodes_by_role('controller')
-    for controller in controllers:
-        set_show_multiple_locations(controller)
+    run_on_nodes(controllers, set_show_multiple_locations, check=True)
     wait_glance_alive()
     yield
-    for controller in controllers:
-        reset_show_multiple_locations(controller)
+    run_on_nodes(controllers, reset_show_multiple_locations, check=True)
     wait_glance_alive()
 
 
@@ -171,21 +170,17 @@ def enable_multiple_locations_glance(env):
 def enable_image_direct_url_glance(env):
     """Change show_image_direct_url to True"""
 
-    def set_show_image_direct_url(node):
-        with node.ssh() as remote:
-            remote.check_call('mv /etc/glance/glance-api.conf '
-                              '/etc/glance/glance-api.conf.orig')
-            remote.check_call("cat /etc/glance/glance-api.conf.orig | sed "
-                              "'s/show_image_direct_url = False/"
-                              "show_image_direct_url = True/g' > "
-                              "/etc/glance/glance-api.conf")
-            remote.check_call('service glance-api restart')
-
-    def reset_show_image_direct_url(node):
-        with node.ssh() as remote:
-            remote.check_call('mv /etc/glance/glance-api.conf.orig '
-                              '/etc/glance/glance-api.conf')
-            remote.check_call('service glance-api restart')
+    set_show_image_direct_url = (
+        "mv /etc/glance/glance-api.conf /etc/glance/glance-api.conf.orig && "
+        "cat /etc/glance/glance-api.conf.orig | sed "
+        "'s/show_image_direct_url = False/"
+        "show_image_direct_url = True/g' > "
+        "/etc/glance/glance-api.conf && "
+        "service glance-api restart")
+
+    reset_show_image_direct_url = (
+        'mv /etc/glance/glance-api.conf.orig /etc/glance/glance-api.conf && '
+        'service glance-api restart')
 
     def wait_glance_alive():
         common.wait(lambda: common.get_os_conn(env), timeout_seconds=60 * 3,
@@ -193,10 +188,8 @@ def enable_image_direct_url_glance(env):
                     expected_exceptions=Exception)
 
     controllers = env.get_nodes_by_role('controller')
-    for controller in controllers:
-        set_show_image_direct_url(controller)
+    run_on_nodes(controllers, set_show_image_direct_url, check=True)
     wait_glance_alive()
     yield
-    for controller in controllers:
-        reset_show_image_direct_url(controller)
+    run_on_nodes(controllers, reset_show_image_direct_url, check=True)
     wait_glance_alive()
@@ -29,8 +29,8 @@ class MuranoActions(object):
         self.murano_endpoint = os_conn.session.get_endpoint(
             service_type='application-catalog', endpoint_type='publicURL')
         self.murano = MuranoClient(endpoint=self.murano_endpoint,
-                                   token=os_conn.session.get_token(),
-                                   cacert=os_conn.path_to_cert)
+                                   session=os_conn.session,
+                                   service_type='application-catalog')
 
     def rand_name(self, name):
         return name + '_' + str(random.randint(1, 0x7fffffff))
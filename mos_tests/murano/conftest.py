@@ -37,9 +37,11 @@ def controller_remote(env):
         yield remote
 
 
-@pytest.fixture
+@pytest.yield_fixture
 def openstack_client(controller_remote):
-    return os_cli.OpenStack(controller_remote)
+    client = os_cli.OpenStack(controller_remote, persistent=True)
+    yield client
+    client.close()
 
 
 @pytest.yield_fixture
@@ -64,9 +66,11 @@ def keypair(os_conn):
     os_conn.delete_key(key_name=keypair.name)
 
 
-@pytest.fixture
+@pytest.yield_fixture
 def murano_cli(controller_remote):
-    return functools.partial(os_cli.Murano(controller_remote))
+    client = os_cli.Murano(controller_remote, persistent=True)
+    yield functools.partial(client)
+    client.close()
 
 
 @pytest.fixture
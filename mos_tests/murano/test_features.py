@@ -60,18 +60,24 @@ def role(openstack_client, role_name):
 @pytest.yield_fixture
 def user_env(openstack_client, suffix, role):
     name = 'test_user_{0}'.format(suffix[:4])
-    user = openstack_client.user_create(name=name, password='password',
-                                        project='services')
-    openstack_client.assign_role_to_user(role['name'], user['name'],
-                                         user['project_id'])
+    with openstack_client.batch() as batch:
+        batch('user create',
+              params='{0} --password password --project services '
+                     '-f json'.format(name))
+        batch('role add',
+              params='{0} --user {1} --project services -f json'.format(
+                  role['name'], name))
+    user = openstack_client.details(batch.results[0])
     yield ('env OS_TENANT_NAME=services OS_PROJECT_NAME=services '
            'OS_USERNAME={name} OS_PASSWORD=password'.format(**user))
     openstack_client.user_delete(name=name)
 
 
-@pytest.fixture
+@pytest.yield_fixture
 def murano_cli(controller_remote, user_env):
-    return functools.partial(os_cli.Murano(controller_remote), prefix=user_env)
+    client = os_cli.Murano(controller_remote, persistent=True)
+    yield functools.partial(client, prefix=user_env)
+    client.close()
 
 
 @pytest.yield_fixture
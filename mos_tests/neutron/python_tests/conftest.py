@@ -27,9 +27,9 @@ def clear_l3_ban(env, os_conn):
     controllers = env.get_nodes_by_role('controller')
     ip = controllers[0].data['ip']
     with env.get_ssh_to_node(ip) as remote:
-        for node in controllers:
-            remote.execute("pcs resource clear neutron-l3-agent {0}".format(
-                node.data['fqdn']))
+        remote.execute('; '.join(
+            "pcs resource clear neutron-l3-agent {0}".format(
+                node.data['fqdn']) for node in controllers))
 
 
 @pytest.fixture
@@ -17,13 +17,9 @@ from collections import namedtuple
 from contextlib import contextmanager
 import logging
 import re
-import signal
 import subprocess
-import threading
 
 import pytest
-from six.moves.queue import Empty
-from six.moves.queue import Queue
 
 from mos_tests.environment.devops_client import DevopsClient
 from mos_tests.functions.common import wait
@@ -69,47 +65,6 @@ def ping_groups(stdout):
         prev_seq = seq
 
 
-class PingThread(threading.Thread):
-    def __init__(self, remote, ip_to_ping,
-                 timeout=10 * 60, *args, **kwargs):
-        super(PingThread, self).__init__(*args, **kwargs)
-        self.stdout_q = Queue()
-        self._stop = threading.Event()
-        self.remote = remote
-        self.ip_to_ping = ip_to_ping
-        self.timeout = timeout
-        self.stdin = None
-        self.chan = None
-
-    def run(self):
-        remote = self.remote
-        command = 'ping {0} 2&>1'.format(self.ip_to_ping)
-        self.chan, self.stdin, stdout, _ = remote.execute_async(command)
-        for line in stdout:
-            self.stdout_q.put(line)
-
-    def stop(self):
-        self._stop.set()
-        if self.stdin is not None:
-            self.stdin.write(chr(signal.SIGINT))
-            self.stdin.flush()
-        if self.chan is not None:
-            self.chan.close()
-
-    def stopped(self):
-        return self._stop.isSet()
-
-    def iter_output(self):
-        while True:
-            try:
-                yield self.stdout_q.get(timeout=self.timeout)
-            except Empty:
-                self.stop()
-                self._Thread__stop()
-                raise Exception('Timeout was reached during communicate '
-                                'with thread')
-
-
 @pytest.mark.check_env_('is_l3_ha', 'has_2_or_more_computes')
 class TestL3HA(TestBase):
     """Tests for L3 HA"""
@@ -168,27 +123,24 @@ class TestL3HA(TestBase):
 
         with self.os_conn.ssh_to_instance(self.env, vm, vm_keypair,
                                           proxy_node=proxy_node) as remote:
-            t = PingThread(remote=remote, ip_to_ping=ip_to_ping)
             logger.info('Start ping on {0}'.format(ip_to_ping))
-            t.start()
-
-            groups = ping_groups(t.iter_output())
-
-            # Wait for 10 not interrupted packets
-            for ping_info in groups:
-                if ping_info.group_len >= 10:
-                    break
-
-            yield result
-
-            logger.info('Wait for ping restored')
-            for ping_info in groups:
-                result['received'] = ping_info.received
-                result['sent'] = ping_info.sent
-                if ping_info.group_len >= good_pings:
-                    break
-            t.stop()
-            t.join()
+            with remote.stream('ping {0}'.format(ip_to_ping)) as ping:
+                groups = ping_groups(ping.iter_lines(timeout=10 * 60))
+
+                # Wait for 10 not interrupted packets
+                for ping_info in groups:
+                    if ping_info.group_len >= 10:
+                        break
+
+                yield result
+
+                logger.info('Wait for ping restored')
+                for ping_info in groups:
+                    result['received'] = ping_info.received
+                    result['sent'] = ping_info.sent
+                    if ping_info.group_len >= good_pings:
+                        break
+                ping.interrupt()
 
     def get_active_l3_agents_for_router(self, router_id):
         agents = self.os_conn.get_l3_for_router(router_id)
@@ -16,7 +16,6 @@ from contextlib import contextmanager
 from distutils.spawn import find_executable
 import logging
 import subprocess
-import threading
 
 import pytest
 
@@ -33,29 +32,18 @@ def tcpdump(ip, env, log_path, tcpdump_args):
 
     Log will download to log_path argument
     """
-    def tcpdump(ip):
-        logger.info('Start tcpdump on {0}'.format(ip))
-        with env.get_ssh_to_node(ip) as remote:
-            result = remote.execute(
-                'tcpdump -U {0} -w /tmp/vxlan.log'.format(tcpdump_args))
-            assert result['exit_code'] == 0
-
-    thread = threading.Thread(target=tcpdump, args=(ip,))
-    try:
-        # Start tcpdump
-        thread.start()
-        yield
-    except Exception:
-        raise
-    else:
+    logger.info('Start tcpdump on {0}'.format(ip))
+    with env.get_ssh_to_node(ip) as remote:
+        command = 'tcpdump -U {0} -w /tmp/vxlan.log'.format(tcpdump_args)
+        with remote.stream(command) as dump:
+            try:
+                yield
+            finally:
+                # Stop tcpdump
+                dump.interrupt()
+                dump.wait(timeout=60)
         # Download log
-        with env.get_ssh_to_node(ip) as remote:
-            remote.download('/tmp/vxlan.log', log_path)
-    finally:
-        # Kill tcpdump
-        with env.get_ssh_to_node(ip) as remote:
-            remote.execute('killall tcpdump')
-        thread.join(0)
+        remote.download('/tmp/vxlan.log', log_path)
 
 
 def tcpdump_vxlan(ip, env, log_path):
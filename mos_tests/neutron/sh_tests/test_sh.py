@@ -18,6 +18,8 @@ import re
 
 import pytest
 
+from mos_tests.environment.ssh import OutputSummary
+
 logger = logging.getLogger(__name__)
 
 
@@ -47,9 +49,10 @@ def run_test(path, node):
         logger.info('Executing {}'.format(filename))
         remote.upload(path, filename)
         remote.check_call('chmod a+x {}'.format(filename))
-        result = remote.execute('./{} 2>&1'.format(filename))
-        logger.info('Stdout:')
-        logger.info(''.join(result['stdout']))
+        command = './{} 2>&1'.format(filename)
+        result = remote.execute(command, verbose=False)
+        logger.info(u'Stdout:\n%s',
+                    OutputSummary(command, result.get_bytes('stdout')))
         assert result['exit_code'] == 0
 
 
@@ -0,0 +1,66 @@
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Session statistics of ssh operations, OpenStack API calls and waits.
+
+Top entries of each statistics are shown in terminal summary. Full
+statistics are written at session end only to requested files:
+
+    --ssh-stats     ssh connect/exec/transfer durations, bytes and retries
+                    by host and command template
+    --api-stats     OpenStack API requests durations and errors by service
+                    and method
+    --wait-profile  time blocked in `common.wait` by call site and
+                    `waiting_for` template, with polls, timeouts and
+                    exceptions swallowed with `expected_exceptions`
+
+Example: `py.test mos_tests --ssh-stats=ssh_stats.csv` writes csv file
+near report.xml.
+"""
+
+from mos_tests.environment import os_actions
+from mos_tests.environment import ssh
+from mos_tests.functions import common
+from mos_tests.functions.stats import MetricsReport
+
+reports = (
+    MetricsReport(ssh.metrics, "--ssh-stats",
+                  what="ssh commands statistics",
+                  title='slowest ssh operations (total time)',
+                  columns='{host} {operation} {command}'),
+    MetricsReport(os_actions.api_metrics, "--api-stats",
+                  what="OpenStack API requests statistics",
+                  title='slowest OpenStack API calls (total time)',
+                  columns='{service} {method} errors: {errors}'),
+    MetricsReport(common.wait_metrics, "--wait-profile",
+                  what="waits statistics",
+                  title='top wait sites (total blocked time)',
+                  columns='polls {polls:<5d} timeouts {timeouts:<3d} '
+                          'swallowed {swallowed:<4d} {site} {waiting_for}'),
+)
+
+
+def pytest_addoption(parser):
+    for report in reports:
+        report.addoption(parser)
+
+
+def pytest_sessionfinish(session):
+    for report in reports:
+        report.dump(session.config)
+
+
+def pytest_terminal_summary(terminalreporter):
+    for report in reports:
+        report.summary(terminalreporter)
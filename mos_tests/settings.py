@@ -31,6 +31,17 @@ KEYSTONE_CREDS = {'username': KEYSTONE_USER,
                   'password': KEYSTONE_PASS,
                   'tenant_name': os.environ.get('KEYSTONE_TENANT', 'admin')}
 
+# Keystone tokens are refreshed when they expire in this time (in seconds),
+# but not earlier than after 2/3 of token lifetime
+KEYSTONE_TOKEN_REFRESH_MARGIN = int(os.environ.get(
+    'KEYSTONE_TOKEN_REFRESH_MARGIN', 60))
+
+# HTTP connections pool size (per host) of OpenStack API clients and count of
+# retries (with exponential backoff) on connection errors and 5xx responses
+API_POOL_MAXSIZE = int(os.environ.get('API_POOL_MAXSIZE', 20))
+API_RETRIES = int(os.environ.get('API_RETRIES', 3))
+API_RETRY_BACKOFF = float(os.environ.get('API_RETRY_BACKOFF', 0.5))
+
 PUBLIC_TEST_IP = os.environ.get('PUBLIC_TEST_IP', '8.8.8.8')
 
 # Path to folder with required images
@@ -42,6 +53,37 @@ WIN_SERVER_QCOW2 = 'windows_server_2012_r2_standard_eval_kvm_20140607.qcow2'
 
 CONSOLE_LOG_LEVEL = os.environ.get('LOG_LEVEL', logging.DEBUG)
 
+# Idle pooled ssh connections lifetime (in seconds)
+SSH_POOL_IDLE_TTL = int(os.environ.get('SSH_POOL_IDLE_TTL', 300))
+
+# Max time (in seconds) to wait keepalive reply on pooled ssh connection
+SSH_POOL_PING_TIMEOUT = float(os.environ.get('SSH_POOL_PING_TIMEOUT', 5))
+
+# Count of consecutive ssh connection failures to open circuit for host (after
+# that connections fail fast) and time (in seconds) before next try
+SSH_BREAKER_THRESHOLD = int(os.environ.get('SSH_BREAKER_THRESHOLD', 6))
+SSH_BREAKER_RESET_TIMEOUT = int(os.environ.get('SSH_BREAKER_RESET_TIMEOUT',
+                                               10))
+
+# Lifetime of cached results of remote probes like `hiera roles` (in seconds)
+REMOTE_FACTS_TTL = int(os.environ.get('REMOTE_FACTS_TTL', 300))
+
+# Count of first and last lines of command output to write to log
+COMMAND_OUTPUT_LOG_LINES = int(os.environ.get('COMMAND_OUTPUT_LOG_LINES', 20))
+
+# Folder for full output of commands, which is too long for log
+COMMAND_OUTPUT_DIR = os.environ.get('COMMAND_OUTPUT_DIR', 'command_output')
+
+# Poll intervals of `wait` have random +-WAIT_JITTER part
+WAIT_JITTER = float(os.environ.get('WAIT_JITTER', 0.1))
+
+# Max poll interval of `wait` with sleep_seconds=(min, None)
+WAIT_MAX_SLEEP = float(os.environ.get('WAIT_MAX_SLEEP', 60))
+
+# File with observed waits durations, which are used to predict waits
+# completion (not set by default - nothing is collected)
+WAIT_STATS_FILE = os.environ.get('WAIT_STATS_FILE')
+
 # Openstack Apache proxy config file
 PROXY_CONFIG_FILE = '/etc/apache2/sites-enabled/25-apache_api_proxy.conf'
 
@@ -53,6 +95,10 @@ GLANCE_IMAGE_URL = os.environ.get(
     'GLANCE_IMAGE_URL',
     'http://download.cirros-cloud.net/0.3.4/cirros-0.3.4-x86_64-disk.img')
 
+# Run glance CLI commands inside test process instead of spawning new one
+GLANCE_CLI_IN_PROCESS = os.environ.get('GLANCE_CLI_IN_PROCESS',
+                                       'false').lower() == 'true'
+
 MURANO_PACKAGE_WITH_DEPS_URL = "http://storage.apps.openstack.org/apps/io.murano.apps.docker.DockerApp.zip"  # noqa
 MURANO_PACKAGE_WITH_DEPS_FQN = "io.murano.apps.docker.DockerApp"
 MURANO_PACKAGE_DEPS_NAMES = (
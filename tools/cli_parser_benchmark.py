@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmark for CLI tables parsing.
+
+Compares `tempest.lib.cli.output_parser` with
+`mos_tests.functions.output_parser` on synthetic tables with columns
+of `glance image-list` and `ceilometer sample-list` (rows are generated
+by this script, see FIXTURES) and checks, that results are equal.
+
+Usage:
+
+    $ python tools/cli_parser_benchmark.py --rows 5000 --repeat 3
+"""
+
+from __future__ import print_function
+
+import optparse
+import os
+import sys
+import time
+import uuid
+
+from tempest.lib.cli import output_parser as tempest_parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mos_tests.functions import output_parser  # noqa
+
+FIXTURES = {
+    'glance image-list': (
+        ('ID', 'Name'),
+        lambda i: (str(uuid.uuid4()), 'TestVM-{}'.format(i)),
+    ),
+    'ceilometer sample-list': (
+        ('Resource ID', 'Name', 'Type', 'Volume', 'Unit', 'Timestamp'),
+        lambda i: (str(uuid.uuid4()), 'cpu_util', 'gauge',
+                   '{:.3f}'.format(i * 0.127), '%',
+                   '2016-05-1{}T10:00:{:02d}'.format(i % 10, i % 60)),
+    ),
+}
+
+
+def make_table(headers, rows):
+    widths = [max(len(x) for x in column) for column in zip(headers, *rows)]
+    delimiter = '+' + '+'.join('-' * (x + 2) for x in widths) + '+'
+
+    def line(values):
+        return '| ' + ' | '.join(
+            x.ljust(w) for x, w in zip(values, widths)) + ' |'
+
+    lines = [delimiter, line(headers), delimiter]
+    lines.extend(line(x) for x in rows)
+    lines.append(delimiter)
+    return '\n'.join(lines) + '\n'
+
+
+def measure(func, output, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func(output)
+        duration = time.time() - start
+        best = duration if best is None else min(best, duration)
+    return best, result
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--rows', type='int', default=5000,
+                      help='count of rows in table')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='number of runs for each parser')
+    options, _ = parser.parse_args()
+
+    print('{:<26}{:<12}{:>10}'.format('table', 'parser', 'best, s'))
+    for name, (headers, make_row) in sorted(FIXTURES.items()):
+        rows = [make_row(i) for i in range(options.rows)]
+        output = make_table(headers, rows)
+        results = []
+        for parser_name, func in (('tempest', tempest_parser.listing),
+                                  ('mos_tests', output_parser.listing)):
+            duration, result = measure(func, output, options.repeat)
+            results.append(result)
+            print('{:<26}{:<12}{:>10.4f}'.format(name, parser_name,
+                                                 duration))
+        assert results[0] == results[1], 'Parsing results are different'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+#    Copyright 2016 Mirantis, Inc.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Micro-benchmark for reading command output from ssh channel.
+
+Compares old busy-wait channel reading loop with
+`mos_tests.environment.ssh.read_channel` against local paramiko server,
+which executes commands with local shell.
+
+Usage:
+
+    $ python tools/ssh_read_benchmark.py --size 50 --repeat 3
+"""
+
+from __future__ import print_function
+
+import multiprocessing
+import optparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import paramiko
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mos_tests.environment.ssh import read_channel  # noqa
+
+
+class LocalServer(paramiko.ServerInterface):
+    """Accepts any password and runs exec requests with local shell"""
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        thread = threading.Thread(target=self._run, args=(channel, command))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    @staticmethod
+    def _run(channel, command):
+        proc = subprocess.Popen(command, shell=True,
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+
+        def pump(stream, send):
+            for chunk in iter(lambda: stream.read(32768), b''):
+                try:
+                    send(chunk)
+                except socket.error:
+                    # client closed channel
+                    proc.kill()
+                    return
+
+        def feed():
+            for chunk in iter(lambda: channel.recv(32768), b''):
+                try:
+                    proc.stdin.write(chunk)
+                    proc.stdin.flush()
+                except IOError:
+                    break
+            proc.stdin.close()
+
+        stdin_thread = threading.Thread(target=feed)
+        stdin_thread.daemon = True
+        stdin_thread.start()
+        pumps = [threading.Thread(target=pump, args=x)
+                 for x in ((proc.stdout, channel.sendall),
+                           (proc.stderr, channel.sendall_stderr))]
+        for thread in pumps:
+            thread.start()
+        for thread in pumps:
+            thread.join()
+        channel.send_exit_status(proc.wait())
+        channel.shutdown_write()
+        channel.close()
+
+
+def serve(sock):
+    host_key = paramiko.RSAKey.generate(2048)
+    while True:
+        conn, _ = sock.accept()
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(host_key)
+        transport.start_server(server=LocalServer())
+
+
+def start_server():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(10)
+    proc = multiprocessing.Process(target=serve, args=(sock,))
+    proc.daemon = True
+    proc.start()
+    return proc, sock.getsockname()[1]
+
+
+def busy_wait_read(chan):
+    """Channel reading loop used by SSHClient.execute before"""
+    output = {'stdout': b'', 'stderr': b''}
+
+    def read_from_chan():
+        while chan.recv_ready():
+            output['stdout'] += chan.recv(1024)
+        while chan.recv_stderr_ready():
+            output['stderr'] += chan.recv_stderr(1024)
+
+    while not chan.exit_status_ready():
+        read_from_chan()
+
+    read_from_chan()
+    return output['stdout'], output['stderr'], chan.recv_exit_status()
+
+
+def measure(client, reader, command):
+    chan = client.get_transport().open_session()
+    start_cpu = sum(os.times()[:2])
+    start = time.time()
+    chan.exec_command(command)
+    stdout, _, _ = reader(chan)
+    chan.close()
+    return time.time() - start, sum(os.times()[:2]) - start_cpu, len(stdout)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--size', type='int', default=20,
+                      help='command output size in MB')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='number of runs for each reader')
+    options, _ = parser.parse_args()
+
+    proc, port = start_server()
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect('127.0.0.1', port=port, username='user', password='pass',
+                   look_for_keys=False, allow_agent=False)
+
+    command = 'yes "conntrack -L output line" | head -c {}'.format(
+        options.size * 1024 * 1024)
+    print('{:<16}{:>10}{:>10}{:>12}'.format('reader', 'wall, s', 'cpu, s',
+                                            'bytes'))
+    for name, reader in (('busy wait', busy_wait_read),
+                         ('read_channel', read_channel)):
+        for _ in range(options.repeat):
+            wall, cpu, size = measure(client, reader, command)
+            print('{:<16}{:>10.3f}{:>10.3f}{:>12}'.format(name, wall, cpu,
+                                                         size))
+    client.close()
+    proc.terminate()
+
+
+if __name__ == '__main__':
+    main()